@@ -0,0 +1,151 @@
+import asyncio
+import collections
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import AnilistFetch
+import AnilistPaging
+from AnilistPaging import FIRST_PAGE, isLastPage, lastPageOf
+from AnilistFetch import splitMediaFields, getUserIdFromUsername, queryUserStatuses, queryMediaRatingPage, hydrateMedia, useCachedMedia, addMediaRatings, pageStatuses, MEDIA_PAGE_SIZE, DEFAULT_YEAR
+from AnilistStats import WrappedContext, computeWrapped, statsNeedScores, statsMediaFields, STATS
+from AnilistParallel import packChunk, computeChunk
+
+DEFAULT_MAX_IN_FLIGHT = 8
+
+# Async counterpart of AnilistPaging.iterPages: up to lookAhead pages past the
+# one being read are in flight through run(), and the responses come back in
+# page order. Pages cachedPage returns are taken before requesting past them.
+async def fetchPages(fetchPage, field, run, cachedPage=None):
+    response = await run(fetchPage, FIRST_PAGE)
+    responses = [response]
+    if isLastPage(response, field, FIRST_PAGE):
+        return responses
+
+    lastPage = lastPageOf(response)
+    pending = collections.deque()
+    nextPage = FIRST_PAGE + 1
+
+    try:
+        while True:
+            while len(pending) < AnilistPaging.lookAhead and (lastPage is None or nextPage <= lastPage):
+                response = await run(cachedPage, nextPage) if cachedPage is not None else None
+                if response is None:
+                    task = asyncio.ensure_future(run(fetchPage, nextPage))
+                else:
+                    task = asyncio.get_running_loop().create_future()
+                    task.set_result(response)
+                    if isLastPage(response, field, nextPage):
+                        lastPage = nextPage
+                pending.append((nextPage, task))
+                nextPage += 1
+
+            if not pending:
+                return responses
+
+            page, task = pending.popleft()
+            response = await task
+            responses.append(response)
+            if isLastPage(response, field, page):
+                return responses
+    finally:
+        for page, task in pending:
+            task.cancel()
+
+async def fetchActivities(userId, mediaStore, run, mediaFields, window):
+    inlineFields, heavyFields = splitMediaFields(mediaFields)
+
+    responses = await fetchPages(lambda page: queryUserStatuses(userId, page, inlineFields, window), 'activities', run, lambda page: queryUserStatuses(userId, page, inlineFields, window, True))
+    activities = [mediaStore.normalize(status) for response in responses for status in pageStatuses(response)]
+
+    if heavyFields:
+        await hydrateActivities(activities, mediaStore, heavyFields, run)
+    return activities
+
+async def hydrateActivities(activities, mediaStore, heavyFields, run):
+    ids = [mediaId for mediaId in {activity.mediaId for activity in activities} if mediaId not in mediaStore.hydrated and not useCachedMedia(mediaId, mediaStore, heavyFields)]
+    chunks = [ids[i:i + MEDIA_PAGE_SIZE] for i in range(0, len(ids), MEDIA_PAGE_SIZE)]
+
+    await asyncio.gather(*[run(hydrateMedia, chunk, mediaStore, heavyFields) for chunk in chunks])
+
+async def fetchScores(userId, run):
+    showScoreDict = {}
+
+    for response in await fetchPages(lambda page: queryMediaRatingPage(userId, page), 'mediaList', run, lambda page: queryMediaRatingPage(userId, page, True)):
+        addMediaRatings(showScoreDict, response)
+
+    return showScoreDict
+
+# Async counterpart of buildWrapped: the activity pages and the score pages of a
+# user are paged concurrently, and run() decides where each blocking request goes.
+# compute(context, activities, stats), when given, computes the report instead
+# of computeWrapped on run().
+async def fetchWrapped(username, run, stats=None, year=DEFAULT_YEAR, compute=None):
+
+    if stats is None:
+        stats = list(STATS.keys())
+
+    userId = await run(getUserIdFromUsername, username)
+    context = WrappedContext(username, userId, year=year)
+    mediaFields = statsMediaFields(stats)
+
+    if statsNeedScores(stats):
+        activities, context.showScoreDict = await asyncio.gather(fetchActivities(userId, context.mediaStore, run, mediaFields, context.window), fetchScores(userId, run))
+    else:
+        activities = await fetchActivities(userId, context.mediaStore, run, mediaFields, context.window)
+
+    if compute is not None:
+        return await compute(context, activities, stats)
+    return await run(computeWrapped, context, activities, stats)
+
+# Generates Wrapped reports for many users concurrently, yielding
+# (username, report) pairs as each user finishes. Requests run on a pool of
+# maxInFlight threads sharing one HTTP connection pool, so at most maxInFlight
+# requests are in flight at once. With processes set the stats are computed on
+# a pool of that many worker processes (AnilistParallel) rather than on the
+# request threads. A user whose report fails is yielded with the exception in
+# place of the report instead of stopping the batch.
+async def wrappedBatch(usernames, stats=None, maxInFlight=DEFAULT_MAX_IN_FLIGHT, maxUsers=None, year=DEFAULT_YEAR, processes=None):
+
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=maxInFlight)
+    processPool = ProcessPoolExecutor(max_workers=processes) if processes else None
+    AnilistFetch.configureSession(maxInFlight)
+
+    # Enough users in progress to keep every request slot busy without holding
+    # the whole community's activity in memory at once.
+    userSlots = asyncio.Semaphore(maxUsers if maxUsers is not None else maxInFlight * 2)
+
+    async def run(function, *args):
+        return await loop.run_in_executor(executor, function, *args)
+
+    async def computeInPool(context, activities, stats):
+        chunk = await run(packChunk, [(context, activities)], stats)
+        report = (await loop.run_in_executor(processPool, computeChunk, chunk))[0][1]
+        if isinstance(report, Exception):
+            raise report
+        return report
+
+    async def runUser(username):
+        async with userSlots:
+            try:
+                return username, await fetchWrapped(username, run, stats, year, computeInPool if processPool else None)
+            except Exception as e:
+                return username, e
+
+    tasks = [asyncio.ensure_future(runUser(username)) for username in usernames]
+
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+        executor.shutdown(wait=False)
+        if processPool is not None:
+            processPool.shutdown(wait=False)
+
+def runBatch(usernames, stats=None, maxInFlight=DEFAULT_MAX_IN_FLIGHT, year=DEFAULT_YEAR, processes=None):
+
+    async def collect():
+        return {username: report async for username, report in wrappedBatch(usernames, stats, maxInFlight, year=year, processes=processes)}
+
+    return asyncio.run(collect())
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import AnilistDecode
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'anilistwrapped', 'responses.sqlite')
+
+# Seconds a cached response stays fresh, per query type. User ids never change
+# and media metadata rarely does, list activity and scores change whenever the
+# user logs something.
+DEFAULT_TTLS = {
+    'user': 30 * 24 * 60 * 60,
+    'media': 7 * 24 * 60 * 60,
+    'favorites': 24 * 60 * 60,
+    'activities': 6 * 60 * 60,
+    'mediaList': 6 * 60 * 60,
+}
+DEFAULT_TTL = 60 * 60
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Cache hits whose access times are kept in memory before they are written.
+TOUCH_EVERY = 100
+
+def cacheKey(query, variables):
+    payload = json.dumps({'query': query, 'variables': variables}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+# On-disk cache of GraphQL responses keyed on (query text, variables). Entries
+# expire after the TTL of their query type and the least recently used ones are
+# evicted once the stored bodies exceed maxBytes. The size of the bodies is
+# kept as a running total, so the table is only scanned when it goes over, and
+# access times of hits are written TOUCH_EVERY at a time.
+class ResponseCache:
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttls=None, maxBytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls is not None:
+            self.ttls.update(ttls)
+        self.maxBytes = maxBytes
+        self.connection = None
+        self.lock = threading.Lock()
+        self.totalBytes = 0
+        self.touched = {}
+
+    def connect(self):
+        if self.connection is None:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    queryType TEXT,
+                    body TEXT,
+                    size INTEGER,
+                    expires REAL,
+                    accessed REAL
+                )''')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS responsesAccessed ON responses (accessed)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS responsesExpires ON responses (expires)')
+            self.connection.commit()
+            self.totalBytes = self.storedBytes()
+        return self.connection
+
+    def storedBytes(self):
+        return self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def get(self, query, variables):
+        key = cacheKey(query, variables)
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute('SELECT body, expires FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                connection.commit()
+                self.totalBytes -= len(row[0])
+                return None
+            self.touched[key] = now
+            if len(self.touched) >= TOUCH_EVERY:
+                self.flushTouched(connection)
+                connection.commit()
+        return AnilistDecode.loads(row[0])
+
+    def flushTouched(self, connection):
+        connection.executemany('UPDATE responses SET accessed = ? WHERE key = ?', [(accessed, key) for key, accessed in self.touched.items()])
+        self.touched.clear()
+
+    def put(self, query, variables, queryType, response):
+        body = AnilistDecode.dumps(response)
+        now = time.time()
+        expires = now + self.ttls.get(queryType, DEFAULT_TTL)
+        key = cacheKey(query, variables)
+        with self.lock:
+            connection = self.connect()
+            old = connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                (key, queryType, body, len(body), expires, now))
+            self.totalBytes += len(body) - (old[0] if old is not None else 0)
+            if self.totalBytes > self.maxBytes:
+                self.evict(connection)
+            connection.commit()
+
+    # Drops expired entries, then the least recently used ones until the bodies
+    # fit in maxBytes. The total is counted again first, since other processes
+    # may share the file.
+    def evict(self, connection):
+        self.flushTouched(connection)
+        connection.execute('DELETE FROM responses WHERE expires < ?', (time.time(),))
+        self.totalBytes = self.storedBytes()
+        if self.totalBytes <= self.maxBytes:
+            return
+        for key, size in connection.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall():
+            if self.totalBytes <= self.maxBytes:
+                break
+            connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self.totalBytes -= size
+
+    def clear(self):
+        with self.lock:
+            connection = self.connect()
+            connection.execute('DELETE FROM responses')
+            connection.commit()
+            self.totalBytes = 0
+            self.touched.clear()
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                if self.touched:
+                    self.flushTouched(self.connection)
+                    self.connection.commit()
+                self.connection.close()
+                self.connection = None
@@ -0,0 +1,104 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from AnilistMetrics import metrics
+
+FIGURE_SIZE = (20, 10)
+BAR_COLOR = 'maroon'
+
+# Drawing is split from the figure it goes on so that the same charts can be
+# shown interactively through pyplot or rendered headless below.
+
+def drawFavoriteGenre(ax, username, genreDict, year):
+
+    genreNames = list(genreDict.keys())
+    genreData = [x[1] for x in genreDict.values()]
+    genreLabels = [x[0] for x in genreDict.values()]
+
+    bars = ax.barh(genreNames, genreData, color=BAR_COLOR, height=0.8)
+
+    ax.set_xlabel("Number of Shows")
+    ax.set_ylabel("Genres")
+    ax.bar_label(bars, labels=genreLabels, padding=4)
+    ax.set_title(username + " Favorite Genres " + str(year))
+
+def drawScoreDistribution(ax, username, scoresDistributionDict, year):
+
+    scoreLabels = list(scoresDistributionDict.keys())
+    scoreValues = list(scoresDistributionDict.values())
+
+    ax.bar(scoreLabels, scoreValues, color=BAR_COLOR)
+
+    ax.set_xlabel("Score Range")
+    ax.set_ylabel("Number of Shows")
+    ax.set_yticks(range(0, max(scoreValues) + 1))
+    ax.set_title(username + " Score Distribution " + str(year))
+
+CHARTS = {
+    'favoriteGenre': drawFavoriteGenre,
+    'scoreDistribution': drawScoreDistribution,
+}
+
+# Renders charts on the Agg backend onto one figure that is cleared and reused
+# for every chart, so rendering many users neither needs a display nor
+# accumulates figures the way pyplot's global figure registry does.
+class ChartRenderer:
+
+    def __init__(self, figsize=FIGURE_SIZE, dpi=100):
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+
+    # output is a path, a writable binary file, or None to get the encoded
+    # image back as bytes. format defaults to the path's extension, else png.
+    def render(self, chart, username, data, year, output=None, format=None):
+        with metrics.span('chart', chart, format=format):
+            self.ax.clear()
+            CHARTS[chart](self.ax, username, data, year)
+
+            if output is None:
+                buffer = io.BytesIO()
+                self.figure.savefig(buffer, format=format or 'png')
+                return buffer.getvalue()
+
+            self.figure.savefig(output, format=format)
+            return output
+
+renderer = None
+
+def getRenderer():
+    global renderer
+
+    if renderer is None:
+        renderer = ChartRenderer()
+    return renderer
+
+def renderChart(chart, username, data, year, output=None, format=None):
+    return getRenderer().render(chart, username, data, year, output, format)
+
+def chartPath(outputDir, chart, username, year, format):
+    return os.path.join(outputDir, username + '-' + chart + '-' + str(year) + '.' + format)
+
+def renderJob(job):
+    chart, username, data, year, output, format = job
+    return renderChart(chart, username, data, year, output, format)
+
+# Renders (chart, username, data, year) jobs in a pool of worker processes,
+# each reusing its own renderer, and returns the results in job order: file
+# paths when outputDir is given, otherwise the encoded images.
+def renderCharts(jobs, outputDir=None, format='png', processes=None, chunksize=8):
+
+    if outputDir is not None:
+        os.makedirs(outputDir, exist_ok=True)
+
+    tasks = []
+    for chart, username, data, year in jobs:
+        output = chartPath(outputDir, chart, username, year, format) if outputDir is not None else None
+        tasks.append((chart, username, data, year, output, format))
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(renderJob, tasks, chunksize=chunksize))
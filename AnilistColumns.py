@@ -0,0 +1,123 @@
+import warnings
+
+import numpy as np
+
+SCORE_MAX = 100
+DEFAULT_BIN_WIDTH = 5
+
+# Per-show columns for one user's report: one row per unique watched show. A
+# user score of 0 means the show is unrated, a NaN average means AniList has no
+# community score for it.
+class UserColumns:
+
+    def __init__(self, mediaIds, scores, averageScores, durations, episodes):
+        self.mediaIds = mediaIds
+        self.scores = scores
+        self.averageScores = averageScores
+        self.durations = durations
+        self.episodes = episodes
+
+    def __len__(self):
+        return len(self.mediaIds)
+
+class ColumnBuilder:
+
+    def __init__(self):
+        self.rows = {}
+        self.mediaIds = []
+        self.averageScores = []
+        self.durations = []
+        self.episodes = []
+
+    def add(self, activity, media):
+        row = self.rows.get(media.id)
+        if row is None:
+            row = self.rows[media.id] = len(self.mediaIds)
+            self.mediaIds.append(media.id)
+            self.averageScores.append(np.nan if media.averageScore is None else media.averageScore)
+            self.durations.append(media.duration)
+            self.episodes.append(0)
+        self.episodes[row] += activity.episodes()
+
+    # Scores are only needed here, so the score list can still be loading while
+    # the rows are added.
+    def finish(self, showScoreDict):
+        return UserColumns(
+            np.array(self.mediaIds, dtype=np.int64),
+            np.array([showScoreDict.get(mediaId, 0) for mediaId in self.mediaIds], dtype=np.float64),
+            np.array(self.averageScores, dtype=np.float64),
+            np.array(self.durations, dtype=np.float64),
+            np.array(self.episodes, dtype=np.int64))
+
+def binLabels(binWidth=DEFAULT_BIN_WIDTH):
+    edges = range(0, SCORE_MAX, binWidth)
+    return [str(low) + "-" + str(min(low + binWidth, SCORE_MAX)) for low in edges]
+
+# Bin index of every score. Bins are [low, low + binWidth) except the last one,
+# which also holds SCORE_MAX.
+def binIndices(scores, binWidth=DEFAULT_BIN_WIDTH):
+    binCount = len(binLabels(binWidth))
+    return np.minimum((scores // binWidth).astype(np.int64), binCount - 1)
+
+def scoreHistogram(columns, binWidth=DEFAULT_BIN_WIDTH):
+    rated = columns.scores[columns.scores > 0]
+    return np.bincount(binIndices(rated, binWidth), minlength=len(binLabels(binWidth)))
+
+def scoreDistribution(columns, binWidth=DEFAULT_BIN_WIDTH):
+    return dict(zip(binLabels(binWidth), scoreHistogram(columns, binWidth).tolist()))
+
+# Differences between the user's and the community's score on the rated shows
+# AniList has an average for.
+def scoreDifferences(columns):
+    comparable = (columns.scores > 0) & ~np.isnan(columns.averageScores)
+    return columns.scores[comparable] - columns.averageScores[comparable]
+
+# Both deviations are averaged over every watched show, rated or not, and are
+# None for a user who watched nothing.
+def meanAbsoluteDeviation(columns):
+    if len(columns) == 0:
+        return None
+    return float(np.abs(scoreDifferences(columns)).sum() / len(columns))
+
+def signedBias(columns):
+    if len(columns) == 0:
+        return None
+    return float(scoreDifferences(columns).sum() / len(columns))
+
+def scorePercentiles(columns, percentiles=(25, 50, 75)):
+    rated = columns.scores[columns.scores > 0]
+    if len(rated) == 0:
+        return {percentile: None for percentile in percentiles}
+    return dict(zip(percentiles, np.percentile(rated, percentiles).tolist()))
+
+# Lines many users' columns up as rows of a 2-D matrix, padding the shorter
+# ones with NaN, so every stat below is computed for all of them at once.
+def stackColumns(columnsList, field):
+    width = max([len(columns) for columns in columnsList] + [1])
+    matrix = np.full((len(columnsList), width), np.nan)
+    for row, columns in enumerate(columnsList):
+        matrix[row, :len(columns)] = getattr(columns, field)
+    return matrix
+
+def batchScoreStats(columnsList, binWidth=DEFAULT_BIN_WIDTH, percentiles=(25, 50, 75)):
+    scores = stackColumns(columnsList, 'scores')
+    averageScores = stackColumns(columnsList, 'averageScores')
+    showCounts = np.array([len(columns) for columns in columnsList], dtype=np.float64)
+
+    rated = scores > 0
+    comparable = rated & ~np.isnan(averageScores)
+    differences = np.where(comparable, scores - averageScores, 0)
+
+    binCount = len(binLabels(binWidth))
+    bins = binIndices(np.where(rated, scores, 0), binWidth) + np.arange(len(columnsList))[:, None] * binCount
+    histograms = np.bincount(bins[rated], minlength=len(columnsList) * binCount).reshape(len(columnsList), binCount)
+
+    # Users without a single rated show come out as NaN rather than warnings.
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return {
+            'scoreDistribution': histograms,
+            'controversyScore': np.abs(differences).sum(axis=1) / showCounts,
+            'ratingBias': differences.sum(axis=1) / showCounts,
+            'scorePercentiles': np.nanpercentile(np.where(rated, scores, np.nan), percentiles, axis=1).T,
+        }
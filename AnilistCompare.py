@@ -0,0 +1,276 @@
+import collections
+import json
+
+import numpy as np
+
+from AnilistStats import isWatchStatus, computeWrapped
+
+# Comparisons across a community of users without asking AniList for anything
+# more. Every user added is kept as a row of sparse feature vectors: scores keyed
+# by media id, and genre, tag and studio profiles of the shows watched in the
+# report window. Pairwise similarities and shared-show score deltas come from
+# products of these matrices, computed for every pair at once, and leaderboards
+# from the stats of the users' reports.
+#
+# SciPy is not needed: the matrices are kept as CSR arrays (indptr, indices,
+# data), and a product only has to multiply the columns at least two users
+# share, which are expanded a block at a time into dense matrices small enough
+# for a plain matrix product. Columns held by a single user only add to the
+# diagonal.
+
+FEATURES = ('scores', 'genres', 'tags', 'studios')
+COMMUNITY_STATS = ('daysWatched', 'rewatchDays', 'controversyScore', 'ratingBias')
+
+# Cells of the dense blocks multiplied at once, 32 MiB of float64.
+BLOCK_CELLS = 4 * 1024 * 1024
+
+# Rows of features for one kind, built one user at a time. Keys are given
+# columns in the order they are first seen.
+class FeatureBuilder:
+
+    def __init__(self):
+        self.columns = {}
+        self.indptr = [0]
+        self.indices = []
+        self.data = []
+
+    def add(self, weights):
+        for key, weight in weights.items():
+            column = self.columns.get(key)
+            if column is None:
+                column = self.columns[key] = len(self.columns)
+            self.indices.append(column)
+            self.data.append(weight)
+        self.indptr.append(len(self.indices))
+
+    def finish(self):
+        return FeatureMatrix(list(self.columns), np.array(self.indptr, dtype=np.int64), np.array(self.indices, dtype=np.int64), np.array(self.data, dtype=np.float64))
+
+class FeatureMatrix:
+
+    def __init__(self, keys, indptr, indices, data):
+        self.keys = keys
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.rowCount = len(indptr) - 1
+        # Row of every stored value.
+        self.rows = np.repeat(np.arange(self.rowCount), np.diff(indptr))
+
+    # The same sparsity pattern with other values.
+    def withData(self, data):
+        return FeatureMatrix(self.keys, self.indptr, self.indices, data)
+
+    def rowSums(self, data=None):
+        return np.bincount(self.rows, self.data if data is None else data, minlength=self.rowCount)
+
+    def counts(self):
+        return np.diff(self.indptr)
+
+    def norms(self):
+        return np.sqrt(self.rowSums(self.data ** 2))
+
+    # Every value minus the mean of its row.
+    def centered(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = self.rowSums() / self.counts()
+        return self.withData(self.data - means[self.rows])
+
+    def row(self, row):
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    # Dot product of one row with every row, in a single pass over the values.
+    def rowProducts(self, row):
+        vector = np.zeros(len(self.keys))
+        indices, data = self.row(row)
+        vector[indices] = data
+        return self.rowSums(self.data * vector[self.indices])
+
+# left @ right.T for two matrices with the same sparsity pattern, as a dense
+# rowCount x rowCount array.
+def product(left, right):
+    rowCount = left.rowCount
+    result = np.zeros((rowCount, rowCount))
+
+    users = np.bincount(left.indices, minlength=len(left.keys))
+    single = users[left.indices] == 1
+    result[np.diag_indices(rowCount)] += np.bincount(left.rows[single], left.data[single] * right.data[single], minlength=rowCount)
+
+    # Shared columns renumbered from 0, sorted so each block is one slice.
+    shared = ~single
+    position = np.cumsum(users >= 2) - 1
+    columns = position[left.indices[shared]]
+    order = np.argsort(columns, kind='stable')
+    columns = columns[order]
+    rows = left.rows[shared][order]
+    leftData = left.data[shared][order]
+    rightData = right.data[shared][order]
+
+    sharedCount = int((users >= 2).sum())
+    width = max(1, BLOCK_CELLS // max(rowCount, 1))
+    for start in range(0, sharedCount, width):
+        first, last = np.searchsorted(columns, [start, start + width])
+        leftBlock = np.zeros((rowCount, min(width, sharedCount - start)))
+        rightBlock = np.zeros_like(leftBlock)
+        leftBlock[rows[first:last], columns[first:last] - start] = leftData[first:last]
+        rightBlock[rows[first:last], columns[first:last] - start] = rightData[first:last]
+        result += leftBlock @ rightBlock.T
+    return result
+
+# Cosine similarity of every pair of rows; NaN for a row without any weight.
+def cosineSimilarity(matrix):
+    norms = matrix.norms()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return product(matrix, matrix) / np.outer(norms, norms)
+
+# Features of one user from the inputs of their report: every show they
+# scored, and the genres, tags (weighted by rank) and animation studios of
+# the shows they watched in the window, each show counted once.
+def userFeatures(context, activities):
+    watched = {}
+    for activity in activities:
+        if isWatchStatus(activity):
+            watched[activity.mediaId] = None
+
+    genres = collections.Counter()
+    tags = collections.Counter()
+    studios = collections.Counter()
+    for mediaId in watched:
+        media = context.mediaStore[mediaId]
+        genres.update(media.genres)
+        for name, category, rank in media.tags:
+            tags[name] += rank / 100
+        studios.update(media.studios)
+
+    scores = {mediaId: score for mediaId, score in (context.showScoreDict or {}).items() if score > 0}
+    return {'scores': scores, 'genres': genres, 'tags': tags, 'studios': studios}
+
+class Community:
+
+    def __init__(self):
+        self.usernames = []
+        self.rows = {}
+        self.builders = {kind: FeatureBuilder() for kind in FEATURES}
+        self.values = collections.defaultdict(dict)
+        self.matrices = None
+
+    def __len__(self):
+        return len(self.usernames)
+
+    # Adds a user from the context and activities their report was computed
+    # from. Numeric stats of the report feed the leaderboards.
+    def add(self, context, activities, report):
+        if context.username in self.rows:
+            raise Exception("User " + context.username + " is already in the community.")
+        self.rows[context.username] = len(self.usernames)
+        self.usernames.append(context.username)
+        for kind, weights in userFeatures(context, activities).items():
+            self.builders[kind].add(weights)
+        for name, value in report.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.values[name][context.username] = value
+        self.matrices = None
+
+    def matrix(self, kind):
+        if self.matrices is None:
+            self.matrices = {kind: builder.finish() for kind, builder in self.builders.items()}
+        return self.matrices[kind]
+
+    # Taste similarity of every pair of users, in the order they were added.
+    # Scores are centered on each user's mean first, so two users who rank shows
+    # alike are similar even if one scores everything higher.
+    def similarity(self, kind='scores'):
+        matrix = self.matrix(kind)
+        return cosineSimilarity(matrix.centered() if kind == 'scores' else matrix)
+
+    # The users most similar to one user, as (username, similarity) pairs.
+    def mostSimilar(self, username, kind='scores', top=10):
+        matrix = self.matrix(kind)
+        if kind == 'scores':
+            matrix = matrix.centered()
+        row = self.rows[username]
+        norms = matrix.norms()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            similarities = matrix.rowProducts(row) / (norms * norms[row])
+        similarities[row] = np.nan
+        order = [other for other in np.argsort(-similarities, kind='stable').tolist() if not np.isnan(similarities[other])]
+        return [(self.usernames[other], float(similarities[other])) for other in order[:top]]
+
+    # For every pair of users, over the shows both of them scored: how many
+    # there are, the mean of (row user's score - column user's score) and the
+    # root mean square of that difference. Means are NaN without shared shows.
+    def scoreDeltas(self):
+        scores = self.matrix('scores')
+        rated = scores.withData(np.ones_like(scores.data))
+        shared = product(rated, rated)
+        sums = product(scores, rated)
+        squares = product(scores.withData(scores.data ** 2), rated)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            meanDelta = (sums - sums.T) / shared
+            squaredDelta = (squares + squares.T - 2 * product(scores, scores)) / shared
+        return {'sharedShows': shared.astype(np.int64), 'meanDelta': meanDelta, 'rmsDelta': np.sqrt(np.maximum(squaredDelta, 0))}
+
+    # (mediaId, score of first user, score of second user) for every show both
+    # users scored, by media id.
+    def sharedShows(self, first, second):
+        scores = self.matrix('scores')
+        firstIndices, firstData = scores.row(self.rows[first])
+        secondIndices, secondData = scores.row(self.rows[second])
+        common, firstAt, secondAt = np.intersect1d(firstIndices, secondIndices, assume_unique=True, return_indices=True)
+        keys = [scores.keys[column] for column in common.tolist()]
+        order = np.argsort(keys, kind='stable').tolist()
+        return [(keys[i], float(firstData[firstAt[i]]), float(secondData[secondAt[i]])) for i in order]
+
+    # Users ranked by a numeric stat of their report, highest first unless
+    # ascending; users without a value for it are left out.
+    def leaderboard(self, stat, top=10, ascending=False):
+        values = self.values.get(stat, {})
+        ranked = [(username, values[username]) for username in self.usernames if username in values and values[username] == values[username]]
+        ranked.sort(key=lambda item: item[1], reverse=not ascending)
+        return ranked[:top]
+
+    # Saves the feature matrices and stats to a .npz file, so comparisons can be
+    # rerun without recomputing any report.
+    def save(self, path):
+        arrays = {}
+        for kind in FEATURES:
+            matrix = self.matrix(kind)
+            arrays[kind + 'Indptr'] = matrix.indptr
+            arrays[kind + 'Indices'] = matrix.indices
+            arrays[kind + 'Data'] = matrix.data
+        header = {'usernames': self.usernames, 'keys': {kind: self.matrix(kind).keys for kind in FEATURES}, 'values': self.values}
+        np.savez_compressed(path, header=np.array(json.dumps(header)), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        community = cls()
+        with np.load(path) as arrays:
+            header = json.loads(arrays['header'].item())
+            community.usernames = header['usernames']
+            community.rows = {username: row for row, username in enumerate(community.usernames)}
+            community.values.update(header['values'])
+            community.matrices = {}
+            for kind in FEATURES:
+                matrix = community.matrices[kind] = FeatureMatrix(header['keys'][kind], arrays[kind + 'Indptr'], arrays[kind + 'Indices'], arrays[kind + 'Data'])
+                builder = community.builders[kind]
+                builder.columns = {key: column for column, key in enumerate(matrix.keys)}
+                builder.indptr = matrix.indptr.tolist()
+                builder.indices = matrix.indices.tolist()
+                builder.data = matrix.data.tolist()
+        return community
+
+# A community of every user in an exported dataset (AnilistExport), with the
+# given stats computed for its leaderboards. A user whose stats fail is still
+# compared with the others but left off the leaderboards.
+def exportedCommunity(path, stats=COMMUNITY_STATS):
+    from AnilistExport import ExportReader
+
+    community = Community()
+    for context, activities in ExportReader(path).iterUsers():
+        try:
+            report = computeWrapped(context, activities, list(stats))
+        except Exception:
+            report = {}
+        community.add(context, activities, report)
+    return community
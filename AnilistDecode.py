@@ -0,0 +1,41 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Response bodies are decoded with orjson when it is installed, which builds the
+# same dicts and lists as the json module several times faster on full activity
+# pages, and with the standard library otherwise. Both accept bytes or str.
+
+def jsonLoads(data):
+    return json.loads(data)
+
+def jsonDumps(value):
+    return json.dumps(value)
+
+def orjsonLoads(data):
+    return orjson.loads(data)
+
+def orjsonDumps(value):
+    return orjson.dumps(value).decode('utf-8')
+
+DECODERS = {
+    'json': (jsonLoads, jsonDumps),
+}
+if orjson is not None:
+    DECODERS['orjson'] = (orjsonLoads, orjsonDumps)
+
+decoder = 'orjson' if orjson is not None else 'json'
+loads, dumps = DECODERS[decoder]
+
+def configureDecoder(name=None):
+    global decoder, loads, dumps
+
+    if name is None:
+        name = 'orjson' if orjson is not None else 'json'
+    if name not in DECODERS:
+        raise Exception("JSON decoder " + name + " is not available.")
+    decoder = name
+    loads, dumps = DECODERS[name]
@@ -0,0 +1,368 @@
+import json
+import os
+
+import numpy as np
+
+from AnilistFetch import DEFAULT_YEAR, ALL_MEDIA_FIELDS, iterProjectedActivities, queryUserFavorites
+from AnilistStats import WrappedContext, STATS, computeWrapped
+from AnilistStore import ActivityRecord, MediaRecord, MediaStore
+from AnilistParallel import MISSING, packOptional, unpackOptional, unpackScores, computeBatch
+
+# Columnar export of fetched users, so that reports and community-wide analysis
+# can be rerun offline. A dataset is a directory holding one media table with
+# every show once, and parts of up to usersPerPart users, each with a users,
+# activities, scores and favorites table:
+#
+#   dataset.json
+#   media.<ext>
+#   part-00000/users.<ext>, activities.<ext>, scores.<ext>, favorites.<ext>
+#
+# Tables are written as NumPy .npy columns (a directory per table), Arrow IPC
+# files or Parquet files; Arrow and Parquet need pyarrow. Reading memory-maps
+# the files, and users are decoded one at a time, so a dataset can be far
+# larger than memory.
+#
+# A table is a dict of columns of equal length. List columns (genres, tags,
+# ...) are (offsets, values) pairs, row i being values[offsets[i]:offsets[i + 1]].
+
+DATASET_FILE = 'dataset.json'
+DEFAULT_FORMAT = 'npy'
+DEFAULT_USERS_PER_PART = 1000
+
+def listColumn(rows, dtype):
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    values = []
+    for i, row in enumerate(rows):
+        values.extend(row)
+        offsets[i + 1] = len(values)
+    return offsets, np.array(values, dtype=dtype)
+
+def stringColumn(values):
+    return np.array(['' if value is None else value for value in values], dtype=str)
+
+def optionalColumn(values, dtype=np.int64):
+    return np.array([packOptional(value) for value in values], dtype=dtype)
+
+def writeNpy(path, table):
+    os.makedirs(path, exist_ok=True)
+    for name, column in table.items():
+        if isinstance(column, tuple):
+            np.save(os.path.join(path, name + '.offsets.npy'), column[0])
+            column = column[1]
+        np.save(os.path.join(path, name + '.npy'), column)
+
+def readNpy(path):
+    table = {}
+    for fileName in os.listdir(path):
+        if fileName.endswith('.npy') and not fileName.endswith('.offsets.npy'):
+            name = fileName[:-len('.npy')]
+            column = np.load(os.path.join(path, fileName), mmap_mode='r')
+            offsetsPath = os.path.join(path, name + '.offsets.npy')
+            table[name] = (np.load(offsetsPath, mmap_mode='r'), column) if os.path.exists(offsetsPath) else column
+    return table
+
+def toArrow(table):
+    import pyarrow as pa
+
+    arrays = {}
+    for name, column in table.items():
+        if isinstance(column, tuple):
+            arrays[name] = pa.LargeListArray.from_arrays(pa.array(column[0], pa.int64()), pa.array(column[1]))
+        else:
+            arrays[name] = pa.array(column)
+    return pa.table(arrays)
+
+def fromArrow(arrowTable):
+    import pyarrow as pa
+
+    table = {}
+    for name in arrowTable.column_names:
+        column = arrowTable.column(name).combine_chunks()
+        if pa.types.is_large_list(column.type):
+            table[name] = (column.offsets.to_numpy(), column.values.to_numpy(zero_copy_only=False))
+        else:
+            table[name] = column.to_numpy(zero_copy_only=False)
+    return table
+
+# Uncompressed so that reading maps the file instead of decoding it.
+def writeArrow(path, table):
+    import pyarrow as pa
+
+    arrowTable = toArrow(table)
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, arrowTable.schema) as writer:
+        writer.write_table(arrowTable)
+
+def readArrow(path):
+    import pyarrow as pa
+
+    return fromArrow(pa.ipc.open_file(pa.memory_map(path)).read_all())
+
+def writeParquet(path, table):
+    import pyarrow.parquet as pq
+
+    pq.write_table(toArrow(table), path)
+
+# Parquet pages are compressed, so they are mapped but still decoded on read.
+def readParquet(path):
+    import pyarrow.parquet as pq
+
+    return fromArrow(pq.read_table(path, memory_map=True))
+
+FORMATS = {
+    'npy': ('', writeNpy, readNpy),
+    'arrow': ('.arrow', writeArrow, readArrow),
+    'parquet': ('.parquet', writeParquet, readParquet),
+}
+
+def mediaTable(mediaRecords):
+    return {
+        'id': np.array([media.id for media in mediaRecords], dtype=np.int64),
+        'title': stringColumn(media.title for media in mediaRecords),
+        'duration': np.array([media.duration for media in mediaRecords], dtype=np.int64),
+        'episodes': optionalColumn(media.episodes for media in mediaRecords),
+        'seasonYear': optionalColumn(media.seasonYear for media in mediaRecords),
+        'format': stringColumn(media.format for media in mediaRecords),
+        'averageScore': optionalColumn(media.averageScore for media in mediaRecords),
+        'genres': listColumn([media.genres for media in mediaRecords], str),
+        'studios': listColumn([media.studios for media in mediaRecords], str),
+        'relations': listColumn([media.relations or () for media in mediaRecords], str),
+        'prequelId': optionalColumn(media.prequelId for media in mediaRecords),
+        'tagName': listColumn([[tag[0] for tag in media.tags] for media in mediaRecords], str),
+        'tagCategory': listColumn([[tag[1] for tag in media.tags] for media in mediaRecords], str),
+        'tagRank': listColumn([[tag[2] for tag in media.tags] for media in mediaRecords], np.int64),
+    }
+
+def rowValues(column, row):
+    offsets, values = column
+    return tuple(values[offsets[row]:offsets[row + 1]].tolist())
+
+def readMediaTable(table):
+    mediaStore = MediaStore()
+    ids = table['id'].tolist()
+    titles = table['title'].tolist()
+    durations = table['duration'].tolist()
+    episodes = table['episodes'].tolist()
+    seasonYears = table['seasonYear'].tolist()
+    formats = table['format'].tolist()
+    averageScores = table['averageScore'].tolist()
+    prequelIds = table['prequelId'].tolist()
+    for row, mediaId in enumerate(ids):
+        media = MediaRecord(mediaId)
+        media.title = titles[row] or None
+        media.duration = durations[row]
+        media.episodes = unpackOptional(episodes[row])
+        media.seasonYear = unpackOptional(seasonYears[row])
+        media.format = formats[row] or None
+        media.averageScore = unpackOptional(averageScores[row])
+        media.genres = rowValues(table['genres'], row)
+        media.studios = rowValues(table['studios'], row)
+        media.relations = rowValues(table['relations'], row)
+        media.prequelId = unpackOptional(prequelIds[row])
+        media.tags = tuple(zip(rowValues(table['tagName'], row), rowValues(table['tagCategory'], row), rowValues(table['tagRank'], row)))
+        mediaStore.media[mediaId] = media
+        mediaStore.hydrated.add(mediaId)
+    return mediaStore
+
+# Writes (context, activities) pairs, the same input AnilistParallel.computeBatch
+# takes. Contexts should have their scores and favourites filled in for the
+# dataset to be usable without the network.
+class ExportWriter:
+
+    def __init__(self, path, format=DEFAULT_FORMAT, usersPerPart=DEFAULT_USERS_PER_PART):
+        if format not in FORMATS:
+            raise Exception("Unknown export format " + format + ".")
+        if os.path.exists(os.path.join(path, DATASET_FILE)):
+            raise Exception("There is already a dataset in " + path + ".")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.format = format
+        self.usersPerPart = usersPerPart
+        self.media = {}
+        # Activity types and statuses are stored as codes into these.
+        self.codes = {'type': {}, 'status': {}}
+        self.parts = []
+        self.pending = []
+        self.userCount = 0
+
+    def writeTable(self, directory, name, table):
+        extension, write, _ = FORMATS[self.format]
+        write(os.path.join(directory, name + extension), table)
+
+    def code(self, field, value):
+        return self.codes[field].setdefault(value, len(self.codes[field]))
+
+    def add(self, context, activities):
+        for activity in activities:
+            if activity.mediaId not in self.media:
+                self.media[activity.mediaId] = context.mediaStore[activity.mediaId]
+        self.pending.append((context, activities))
+        if len(self.pending) >= self.usersPerPart:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        users = {name: [] for name in ('userId', 'username', 'year', 'windowStart', 'windowEnd', 'activityStart', 'activityEnd', 'scoreStart', 'scoreEnd', 'favoriteStart', 'favoriteEnd')}
+        activities = []
+        scoreIds = []
+        scoreValues = []
+        favorites = []
+        for context, userActivities in self.pending:
+            users['userId'].append(context.userId)
+            users['username'].append(context.username)
+            users['year'].append(context.year)
+            users['windowStart'].append(packOptional(context.window[0]))
+            users['windowEnd'].append(packOptional(context.window[1]))
+            users['activityStart'].append(len(activities))
+            activities.extend(userActivities)
+            users['activityEnd'].append(len(activities))
+
+            # A user without scores or favourites is marked with MISSING, which
+            # is not the same as an empty list.
+            if context.showScoreDict is None:
+                users['scoreStart'].append(MISSING)
+                users['scoreEnd'].append(MISSING)
+            else:
+                users['scoreStart'].append(len(scoreIds))
+                scoreIds.extend(context.showScoreDict.keys())
+                scoreValues.extend(context.showScoreDict.values())
+                users['scoreEnd'].append(len(scoreIds))
+
+            if context.favorites is None:
+                users['favoriteStart'].append(MISSING)
+                users['favoriteEnd'].append(MISSING)
+            else:
+                users['favoriteStart'].append(len(favorites))
+                favorites.extend(context.favorites)
+                users['favoriteEnd'].append(len(favorites))
+
+        directory = os.path.join(self.path, 'part-%05d' % len(self.parts))
+        os.makedirs(directory, exist_ok=True)
+        self.writeTable(directory, 'users', {name: stringColumn(values) if name == 'username' else np.array(values, dtype=np.int64) for name, values in users.items()})
+        self.writeTable(directory, 'activities', {
+            'id': optionalColumn(activity.id for activity in activities),
+            'type': np.array([self.code('type', activity.type) for activity in activities], dtype=np.uint8),
+            'status': np.array([self.code('status', activity.status) for activity in activities], dtype=np.uint8),
+            'progressStart': optionalColumn((activity.progressStart for activity in activities), np.int32),
+            'progressEnd': optionalColumn((activity.progressEnd for activity in activities), np.int32),
+            'createdAt': optionalColumn(activity.createdAt for activity in activities),
+            'mediaId': np.array([activity.mediaId for activity in activities], dtype=np.int64),
+        })
+        self.writeTable(directory, 'scores', {'mediaId': np.array(scoreIds, dtype=np.int64), 'score': np.array(scoreValues, dtype=np.float64)})
+        self.writeTable(directory, 'favorites', {'mediaId': np.array(favorites, dtype=np.int64)})
+
+        self.parts.append({'path': os.path.basename(directory), 'users': len(self.pending)})
+        self.userCount += len(self.pending)
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.writeTable(self.path, 'media', mediaTable(list(self.media.values())))
+        with open(os.path.join(self.path, DATASET_FILE), 'w') as file:
+            json.dump({
+                'format': self.format,
+                'users': self.userCount,
+                'media': len(self.media),
+                'parts': self.parts,
+                'types': list(self.codes['type']),
+                'statuses': list(self.codes['status']),
+            }, file, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        return False
+
+class ExportReader:
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, DATASET_FILE)) as file:
+            self.dataset = json.load(file)
+        self.format = self.dataset['format']
+        self.types = self.dataset['types']
+        self.statuses = self.dataset['statuses']
+        self.mediaStore = None
+
+    def __len__(self):
+        return self.dataset['users']
+
+    def readTable(self, directory, name):
+        extension, _, read = FORMATS[self.format]
+        return read(os.path.join(directory, name + extension))
+
+    # Every show in the dataset, decoded once and shared by all users.
+    def getMediaStore(self):
+        if self.mediaStore is None:
+            self.mediaStore = readMediaTable(self.readTable(self.path, 'media'))
+        return self.mediaStore
+
+    def userActivities(self, activities, start, end):
+        columns = [activities[name][start:end].tolist() for name in ('id', 'type', 'status', 'progressStart', 'progressEnd', 'createdAt', 'mediaId')]
+        return [ActivityRecord(unpackOptional(id), self.types[type], self.statuses[status], unpackOptional(progressStart), unpackOptional(progressEnd), unpackOptional(createdAt), mediaId)
+            for id, type, status, progressStart, progressEnd, createdAt, mediaId in zip(*columns)]
+
+    # Yields a (context, activities) pair per user, in the order they were
+    # written, decoding one user at a time from the mapped tables.
+    def iterUsers(self):
+        mediaStore = self.getMediaStore()
+        for part in self.dataset['parts']:
+            directory = os.path.join(self.path, part['path'])
+            users = self.readTable(directory, 'users')
+            activities = self.readTable(directory, 'activities')
+            scores = self.readTable(directory, 'scores')
+            favorites = self.readTable(directory, 'favorites')
+
+            rows = {name: column.tolist() for name, column in users.items()}
+            for row in range(len(rows['userId'])):
+                scoreStart, scoreEnd = rows['scoreStart'][row], rows['scoreEnd'][row]
+                showScoreDict = None
+                if scoreStart != MISSING:
+                    showScoreDict = unpackScores((scores['mediaId'][scoreStart:scoreEnd].tolist(), scores['score'][scoreStart:scoreEnd].tolist()))
+
+                favoriteStart, favoriteEnd = rows['favoriteStart'][row], rows['favoriteEnd'][row]
+                userFavorites = None
+                if favoriteStart != MISSING:
+                    userFavorites = favorites['mediaId'][favoriteStart:favoriteEnd].tolist()
+
+                window = (unpackOptional(rows['windowStart'][row]), unpackOptional(rows['windowEnd'][row]))
+                context = WrappedContext(rows['username'][row], rows['userId'][row], showScoreDict, mediaStore, rows['year'][row], window, userFavorites)
+                yield context, self.userActivities(activities, rows['activityStart'][row], rows['activityEnd'][row])
+
+# Fetches every given user with all media fields, their scores and favourites,
+# and writes them to a dataset.
+def exportUsers(usernames, path, format=DEFAULT_FORMAT, year=DEFAULT_YEAR, usersPerPart=DEFAULT_USERS_PER_PART):
+    mediaStore = MediaStore()
+    with ExportWriter(path, format, usersPerPart) as writer:
+        for username in usernames:
+            context = WrappedContext(username, mediaStore=mediaStore, year=year)
+            context.prefetchScores()
+            activities = list(iterProjectedActivities(context.userId, mediaStore, ALL_MEDIA_FIELDS, context.window))
+            context.getScores()
+            context.favorites = [x['id'] for x in queryUserFavorites(context.userId)['data']['User']['favourites']['anime']['nodes']]
+            writer.add(context, activities)
+    return path
+
+# Reports for every user of a dataset, without the network when the dataset
+# has scores and favourites. With processes set they are computed on a pool of
+# that many processes. Yields (username, report) pairs in dataset order, with
+# the exception in place of the report of a user whose report failed.
+def computeExported(path, stats=None, processes=None):
+
+    if stats is None:
+        stats = list(STATS.keys())
+
+    reader = ExportReader(path)
+    if processes:
+        yield from computeBatch(reader.iterUsers(), stats, processes)
+        return
+
+    for context, activities in reader.iterUsers():
+        try:
+            yield context.username, computeWrapped(context, activities, stats)
+        except Exception as e:
+            yield context.username, e
@@ -0,0 +1,372 @@
+import requests
+import time
+import functools
+import calendar
+import AnilistDecode
+from AnilistCache import ResponseCache
+from AnilistStore import MediaCache
+from AnilistRateLimit import TokenBucket, retryAfterSeconds, backoffSeconds
+from AnilistPaging import iterPages
+from AnilistMetrics import metrics
+
+# Everything that talks to AniList: the shared session, rate limiter and
+# response cache, the GraphQL queries and the paged activity stream.
+
+url = 'https://graphql.anilist.co'
+
+session = requests.Session()
+
+rateLimiter = TokenBucket()
+maxRetries = 5
+
+responseCache = ResponseCache()
+refreshCache = False
+
+# Media metadata shared by all users; see splitMediaFields.
+mediaCache = MediaCache()
+
+# Sends a query through the shared rate limiter. Rate-limited (429) and server
+# error responses as well as dropped connections are retried with jittered
+# backoff, or after Retry-After when AniList sends it.
+def sendQuery(query, variables, queryType=None):
+    for attempt in range(maxRetries + 1):
+        with metrics.span('rateLimitWait', queryType):
+            rateLimiter.acquire()
+
+        try:
+            with metrics.span('graphql', queryType, page=variables.get('page'), attempt=attempt) as span:
+                httpResponse = session.post(url, json={'query': query, 'variables': variables})
+                span.set(status=httpResponse.status_code, bytes=len(httpResponse.content))
+        except (requests.ConnectionError, requests.Timeout):
+            metrics.count('retries', 'connection')
+            if attempt == maxRetries:
+                raise
+            time.sleep(backoffSeconds(attempt))
+            continue
+
+        rateLimiter.update(httpResponse.headers)
+
+        if httpResponse.status_code == 429 or httpResponse.status_code >= 500:
+            metrics.count('retries', str(httpResponse.status_code))
+            retryAfter = retryAfterSeconds(httpResponse.headers)
+            if retryAfter is not None:
+                rateLimiter.pause(retryAfter)
+            else:
+                time.sleep(backoffSeconds(attempt))
+            continue
+
+        with metrics.span('decode', queryType):
+            return AnilistDecode.loads(httpResponse.content)
+
+    raise Exception("AniList request failed after " + str(maxRetries + 1) + " attempts.")
+
+# Every GraphQL call goes through here. Successful responses are served from and
+# stored in responseCache; refreshCache skips the lookup but still stores the
+# fresh response, and setting responseCache to None bypasses caching entirely.
+# With cachedOnly set, only the cache is looked at and a miss returns None.
+def postQuery(query, variables, queryType, cachedOnly=False):
+    if responseCache is not None and not refreshCache:
+        cached = responseCache.get(query, variables)
+        if cached is not None:
+            metrics.count('cacheHits', queryType)
+            return cached
+        if not cachedOnly:
+            metrics.count('cacheMisses', queryType)
+    if cachedOnly:
+        return None
+
+    response = sendQuery(query, variables, queryType)
+
+    if responseCache is not None and 'data' in response and 'errors' not in response:
+        responseCache.put(query, variables, queryType, response)
+    return response
+
+def configureCache(path=None, enabled=True, refresh=False, ttls=None, maxBytes=None):
+    global responseCache, refreshCache
+
+    if responseCache is not None:
+        responseCache.close()
+
+    if not enabled:
+        responseCache = None
+    else:
+        options = {'ttls': ttls}
+        if path is not None:
+            options['path'] = path
+        if maxBytes is not None:
+            options['maxBytes'] = maxBytes
+        responseCache = ResponseCache(**options)
+    refreshCache = refresh
+
+def configureMediaCache(enabled=True, maxEntries=None):
+    global mediaCache
+
+    if not enabled:
+        mediaCache = None
+    else:
+        mediaCache = MediaCache(maxEntries) if maxEntries is not None else MediaCache()
+
+# Sizes the shared connection pool so poolSize requests can be in flight at once.
+def configureSession(poolSize):
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=poolSize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+def configureRateLimit(requestsPerMinute, retries=None):
+    global rateLimiter, maxRetries
+
+    rateLimiter = TokenBucket(requestsPerMinute)
+    if retries is not None:
+        maxRetries = retries
+
+DEFAULT_YEAR = 2023
+
+# A Wrapped year runs from midnight US Eastern on January 1st, which is where the
+# original 2023 report started (1672549200).
+YEAR_START_OFFSET = 5 * 60 * 60
+
+def yearWindow(year):
+    return (calendar.timegm((year, 1, 1, 0, 0, 0)) + YEAR_START_OFFSET, calendar.timegm((year + 1, 1, 1, 0, 0, 0)) + YEAR_START_OFFSET)
+
+def getUserIdFromUsername(username):
+
+    query = '''
+    query($userName: String) {
+        User(name: $userName) {
+            id
+        }
+    }
+    '''
+
+    variables = {'userName': username}
+
+    response = postQuery(query, variables, 'user')
+    if ('errors' in response):
+        raise Exception("Username does not exist.")
+    return response['data']['User']['id']
+
+def queryUserFavorites(userid):
+    query = '''
+    query($userId: Int) {
+        User(id: $userId) {
+            favourites {
+                anime {
+                    nodes {
+                        id
+                        title {
+                            romaji
+                        }
+                    }
+                }
+            }
+        }
+    }
+    '''
+
+    variables = {'userId': userid}
+
+    response = postQuery(query, variables, 'favorites')
+    return response
+
+# GraphQL selection for each media field a stat can ask for.
+MEDIA_FIELDS = {
+    'id': 'id',
+    'title': 'title { romaji }',
+    'duration': 'duration',
+    'episodes': 'episodes',
+    'seasonYear': 'seasonYear',
+    'format': 'format',
+    'averageScore': 'averageScore',
+    'genres': 'genres',
+    'tags': 'tags { name category rank }',
+    'studios': 'studios { nodes { name isAnimationStudio } }',
+    'relations': 'relations { edges { relationType node { id type } } }',
+}
+ALL_MEDIA_FIELDS = tuple(MEDIA_FIELDS.keys())
+
+# List fields that are large and identical in every activity of the same show.
+# When a report needs them they are fetched once per media id by
+# hydrateActivities rather than inside every activity.
+HEAVY_MEDIA_FIELDS = ('genres', 'tags', 'studios', 'relations')
+
+MEDIA_PAGE_SIZE = 50
+ACTIVITY_PAGE_SIZE = 50
+
+# Activities hydrateActivities may hold back while collecting unseen media ids.
+# Flushing after every page would send a media request per activity page for
+# users who keep starting new shows; a few pages keep that close to one request
+# per MEDIA_PAGE_SIZE shows, about as much as the page prefetcher holds anyway.
+HYDRATE_BUFFER_PAGES = 4
+
+def mediaSelection(mediaFields):
+    return ' '.join(MEDIA_FIELDS[field] for field in ALL_MEDIA_FIELDS if field == 'id' or field in mediaFields)
+
+@functools.lru_cache(maxsize=None)
+def buildActivityQuery(mediaFields):
+    return '''
+    query($userId: Int, $page: Int, $perPage: Int, $createdAfter: Int, $createdBefore: Int) {
+        Page(page: $page, perPage: $perPage) {
+            pageInfo {
+                hasNextPage
+            }
+            activities(userId: $userId, createdAt_greater: $createdAfter, createdAt_lesser: $createdBefore) {
+            ... on ListActivity {
+                id
+                createdAt
+                type
+                status
+                progress
+                media {
+                    ''' + mediaSelection(mediaFields) + '''
+                }
+            }
+        }
+        }
+    }'''
+
+@functools.lru_cache(maxsize=None)
+def buildMediaQuery(mediaFields):
+    return '''
+    query($ids: [Int], $perPage: Int) {
+        Page(perPage: $perPage) {
+            media(id_in: $ids) {
+                ''' + mediaSelection(mediaFields) + '''
+            }
+        }
+    }'''
+
+# window is the (createdAfter, createdBefore) range of activity timestamps to
+# fetch, the default Wrapped year when left out.
+def queryUserStatuses(userid, page, mediaFields=ALL_MEDIA_FIELDS, window=None, cachedOnly=False):
+
+    query = buildActivityQuery(tuple(sorted(mediaFields)))
+
+    if window is None:
+        window = yearWindow(DEFAULT_YEAR)
+
+    variables = {'userId': userid, 'page': page, 'perPage': ACTIVITY_PAGE_SIZE, 'createdAfter': window[0], 'createdBefore': window[1]}
+
+    response = postQuery(query, variables, 'activities', cachedOnly)
+    return response
+
+def queryMedia(ids, mediaFields):
+
+    query = buildMediaQuery(tuple(sorted(mediaFields)))
+
+    variables = {'ids': list(ids), 'perPage': MEDIA_PAGE_SIZE}
+
+    response = postQuery(query, variables, 'media')
+    return response['data']['Page']['media']
+
+def hydrateMedia(ids, mediaStore, mediaFields):
+    for media in queryMedia(ids, mediaFields):
+        if mediaCache is not None:
+            mediaStore.share(mediaCache.add(media, mediaFields))
+        else:
+            mediaStore.add(media)
+    mediaStore.hydrated.update(ids)
+
+# Takes the media from the shared media cache when another report already
+# fetched the fields needed.
+def useCachedMedia(mediaId, mediaStore, mediaFields):
+    if mediaCache is None:
+        return False
+    record = mediaCache.get(mediaId, mediaFields)
+    if record is None:
+        metrics.count('mediaCacheMisses')
+        return False
+    metrics.count('mediaCacheHits')
+    mediaStore.share(record)
+    return True
+
+# Fills the heavy media fields into the media store for a stream of activities.
+# Activities whose media is already hydrated pass straight through; the others
+# are held back until a full page of unseen media ids has been collected or
+# HYDRATE_BUFFER_PAGES pages of activities are waiting, so the buffer does not
+# grow with the length of the history.
+def hydrateActivities(activities, mediaStore, mediaFields):
+    pending = []
+    missing = set()
+
+    for activity in activities:
+        pending.append(activity)
+        if activity.mediaId not in mediaStore.hydrated and activity.mediaId not in missing and not useCachedMedia(activity.mediaId, mediaStore, mediaFields):
+            missing.add(activity.mediaId)
+
+        if not missing:
+            yield from pending
+            pending = []
+        elif len(missing) >= MEDIA_PAGE_SIZE or len(pending) >= ACTIVITY_PAGE_SIZE * HYDRATE_BUFFER_PAGES:
+            hydrateMedia(missing, mediaStore, mediaFields)
+            missing = set()
+            yield from pending
+            pending = []
+
+    if missing:
+        hydrateMedia(missing, mediaStore, mediaFields)
+    yield from pending
+
+def queryMediaRatingPage(userid, page, cachedOnly=False):
+    query = '''
+    query($userId: Int, $page: Int, $perPage: Int) {
+        Page(page: $page, perPage: $perPage) {
+            pageInfo {
+                hasNextPage
+                lastPage
+            }
+            mediaList(userId: $userId, type: ANIME) {
+                mediaId
+                score(format: POINT_100)
+            }
+        }
+    }
+    '''
+
+    variables = {'userId': userid, 'page': page, 'perPage': 50}
+
+    response = postQuery(query, variables, 'mediaList', cachedOnly)
+    return response
+
+# showScoreDict maps AniList media id to the user's score out of 100.
+def addMediaRatings(showScoreDict, response):
+    for mediaEntry in response['data']['Page']['mediaList']:
+        showScoreDict[mediaEntry['mediaId']] = mediaEntry['score']
+
+def queryMediaRating(userid):
+
+    showScoreDict = {}
+
+    for response in iterPages(lambda page: queryMediaRatingPage(userid, page), 'mediaList', cachedPage=lambda page: queryMediaRatingPage(userid, page, True)):
+        addMediaRatings(showScoreDict, response)
+
+    return showScoreDict
+
+# Only ListActivity entries carry a status; text and message activities are skipped.
+def pageStatuses(response):
+    return (status for status in response['data']['Page']['activities'] if 'status' in status)
+
+# Activity pages are prefetched a few at a time but normalized in feed order.
+def iterUserActivities(userId, mediaStore, mediaFields=ALL_MEDIA_FIELDS, window=None):
+
+    for response in iterPages(lambda page: queryUserStatuses(userId, page, mediaFields, window), 'activities', cachedPage=lambda page: queryUserStatuses(userId, page, mediaFields, window, True)):
+        for status in pageStatuses(response):
+            yield mediaStore.normalize(status)
+
+# Fields selected inside every activity and fields hydrated once per media id.
+# With the shared media cache on, activities carry only the media id and every
+# field is hydrated, so a show's metadata is downloaded once per process rather
+# than with every activity of every user who watched it.
+def splitMediaFields(mediaFields):
+    if mediaCache is not None:
+        return [], [field for field in mediaFields if field != 'id']
+    inlineFields = [field for field in mediaFields if field not in HEAVY_MEDIA_FIELDS]
+    heavyFields = [field for field in mediaFields if field in HEAVY_MEDIA_FIELDS]
+    return inlineFields, heavyFields
+
+def iterProjectedActivities(userId, mediaStore, mediaFields, window=None):
+    inlineFields, heavyFields = splitMediaFields(mediaFields)
+
+    activities = iterUserActivities(userId, mediaStore, inlineFields, window)
+    if heavyFields:
+        activities = hydrateActivities(activities, mediaStore, heavyFields)
+    return activities
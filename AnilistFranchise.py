@@ -0,0 +1,202 @@
+import collections
+import threading
+
+from AnilistMetrics import metrics
+from AnilistFetch import MEDIA_PAGE_SIZE, queryMedia
+from AnilistStore import MediaRecord
+
+# Franchise classification of shows, computed once per media id and shared by
+# every report in the process: whether a show is a sequel, the anime it follows,
+# the first show of its franchise, and the season year (cohort) it aired in.
+# Media ids are global on AniList, so a classification made for one user holds
+# for all of them. The least recently used ones are evicted past maxEntries.
+
+DEFAULT_MAX_ENTRIES = 100000
+CLASSIFY_FIELDS = ('seasonYear', 'format', 'relations')
+
+# Takes relation types, as MediaRecord keeps them, or the relation edges of a
+# GraphQL media object.
+def isSequel(relations):
+    for relation in relations:
+        if isinstance(relation, dict):
+            relation = relation['relationType']
+        if relation == 'PREQUEL':
+            return True
+    return False
+
+class MediaClass:
+
+    __slots__ = ('id', 'isSequel', 'prequelId', 'seasonYear', 'format', 'rootId')
+
+    def __init__(self, media):
+        self.id = media.id
+        self.isSequel = isSequel(media.relations)
+        self.prequelId = media.prequelId
+        self.seasonYear = media.seasonYear
+        self.format = media.format
+        # Known straight away for shows without a prequel, otherwise filled in
+        # by MediaClassifier.franchiseRoots.
+        self.rootId = media.id if media.prequelId is None else None
+
+class MediaClassifier:
+
+    def __init__(self, maxEntries=DEFAULT_MAX_ENTRIES):
+        self.maxEntries = maxEntries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        # Ids being looked up by some thread, with the event set once they are.
+        self.inFlight = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, mediaId):
+        with self.lock:
+            mediaClass = self.entries.get(mediaId)
+            if mediaClass is not None:
+                self.entries.move_to_end(mediaId)
+            return mediaClass
+
+    def put(self, mediaClass):
+        with self.lock:
+            self.entries[mediaClass.id] = mediaClass
+            self.entries.move_to_end(mediaClass.id)
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    # The classification of a media record with its relations filled in, made
+    # from the record the first time the id is seen.
+    def classify(self, media):
+        mediaClass = self.get(media.id)
+        if mediaClass is None:
+            mediaClass = MediaClass(media)
+            self.put(mediaClass)
+        return mediaClass
+
+    # Classifications of the given ids, looking up the ones not seen yet in
+    # batches of MEDIA_PAGE_SIZE. Shows whose record in mediaStore already has
+    # its relations are classified from it instead, and shows another thread is
+    # looking up are waited for rather than looked up twice. Ids AniList does
+    # not know are left out.
+    def lookup(self, ids, mediaStore=None):
+        classes = {}
+        candidates = []
+        for mediaId in ids:
+            mediaClass = self.get(mediaId)
+            if mediaClass is not None:
+                classes[mediaId] = mediaClass
+                continue
+            media = mediaStore.media.get(mediaId) if mediaStore is not None else None
+            if media is not None and media.relations is not None:
+                classes[mediaId] = self.classify(media)
+            else:
+                candidates.append(mediaId)
+
+        missing = []
+        waiting = {}
+        done = threading.Event()
+        with self.lock:
+            for mediaId in candidates:
+                if mediaId in self.entries:
+                    continue
+                event = self.inFlight.get(mediaId)
+                if event is None:
+                    self.inFlight[mediaId] = done
+                    missing.append(mediaId)
+                else:
+                    waiting[mediaId] = event
+
+        metrics.count('mediaClassLookups', None, len(missing))
+        try:
+            self.fetch(missing, classes)
+        finally:
+            with self.lock:
+                for mediaId in missing:
+                    del self.inFlight[mediaId]
+            done.set()
+
+        for event in waiting.values():
+            event.wait()
+        # Ids the other lookups did not classify, because AniList does not know
+        # them or the lookup failed, are looked up again here.
+        retry = []
+        for mediaId in candidates:
+            if mediaId not in classes:
+                mediaClass = self.get(mediaId)
+                if mediaClass is not None:
+                    classes[mediaId] = mediaClass
+                elif mediaId in waiting:
+                    retry.append(mediaId)
+        self.fetch(retry, classes)
+        return classes
+
+    # Classifies the given ids from AniList into classes, MEDIA_PAGE_SIZE at a
+    # time.
+    def fetch(self, ids, classes):
+        for start in range(0, len(ids), MEDIA_PAGE_SIZE):
+            for media in queryMedia(ids[start:start + MEDIA_PAGE_SIZE], CLASSIFY_FIELDS):
+                record = MediaRecord(media['id'])
+                record.update(media)
+                classes[record.id] = self.classify(record)
+
+    # Maps every given id AniList knows to the first show of its franchise, found
+    # by following prequels. All the prequels missing at one step of the chains
+    # are looked up together, so resolving a batch costs one request per
+    # MEDIA_PAGE_SIZE shows per step rather than one per show. A chain ends
+    # early at a prequel AniList does not return or that closes a loop.
+    def franchiseRoots(self, ids):
+        pending = set(self.lookup(set(ids)))
+        roots = {}
+        unavailable = set()
+        while pending:
+            unknown = set()
+            for mediaId in list(pending):
+                rootId = self.walk(mediaId, unknown, unavailable)
+                if rootId is not None:
+                    roots[mediaId] = rootId
+                    pending.discard(mediaId)
+            if unknown:
+                unavailable.update(unknown - set(self.lookup(unknown)))
+        return roots
+
+    # Follows prequels from mediaId as far as they are classified. Returns the
+    # root and records it on the whole chain, or returns None after adding the
+    # first unclassified prequel to unknown.
+    def walk(self, mediaId, unknown, unavailable):
+        chain = []
+        seen = set()
+        current = self.get(mediaId)
+        if current is None:
+            if mediaId in unavailable:
+                return mediaId
+            unknown.add(mediaId)
+            return None
+        while True:
+            if current.rootId is not None:
+                rootId = current.rootId
+                break
+            chain.append(current)
+            seen.add(current.id)
+            prequelId = current.prequelId
+            if prequelId in seen or prequelId in unavailable:
+                rootId = current.id
+                break
+            prequel = self.get(prequelId)
+            if prequel is None:
+                unknown.add(prequelId)
+                return None
+            current = prequel
+
+        for mediaClass in chain:
+            mediaClass.rootId = rootId
+        return rootId
+
+mediaClassifier = MediaClassifier()
+
+def configureClassifier(maxEntries=DEFAULT_MAX_ENTRIES):
+    mediaClassifier.maxEntries = maxEntries
+    mediaClassifier.clear()
@@ -0,0 +1,276 @@
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import AnilistFetch
+import AnilistPaging
+from AnilistCache import DEFAULT_CACHE_PATH
+from AnilistPaging import FIRST_PAGE, isLastPage, iterPages
+from AnilistRateLimit import backoffSeconds
+from AnilistFetch import DEFAULT_YEAR, yearWindow, getUserIdFromUsername, queryUserStatuses, queryMediaRatingPage, addMediaRatings, pageStatuses, splitMediaFields, hydrateActivities
+from AnilistStats import WrappedContext, STATS, statsNeedScores, statsMediaFields, newColumnBuilder, newWatchTimeBuilder, newAccumulators, feedAccumulators, wrappedResults
+
+# Batch runs that survive errors and restarts. Every page a user's report is
+# built from is written to a local journal as soon as it is downloaded, before
+# its media are looked up and it is fed to the stats, and every few pages the
+# user's whole state (accumulators, media and the next page of each list) is
+# saved as a checkpoint in place of the pages before it. A run started again
+# with the same journal skips finished users and carries on with the others
+# from their checkpoint and journaled pages, so a page is only fetched twice if
+# it was still in flight when the run stopped.
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.dirname(DEFAULT_CACHE_PATH), 'batch.sqlite')
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_ATTEMPTS = 3
+SNAPSHOT_EVERY = 20
+
+ACTIVITIES = 'activities'
+SCORES = 'mediaList'
+
+# Reports in a journal are only reused for the same stats and window.
+def jobKey(stats, window):
+    return json.dumps({'stats': sorted(stats), 'window': list(window)})
+
+# Everything needed to carry on with one user's report: the report context with
+# its media store and the scores read so far, the accumulators fed so far, and
+# the next page of the activity feed and of the score list.
+class UserCheckpoint:
+
+    def __init__(self, context, stats):
+        self.context = context
+        self.accumulators = newAccumulators(context, stats)
+        self.columns = newColumnBuilder(context, stats)
+        self.watchTime = newWatchTimeBuilder(context, stats)
+        self.pages = {ACTIVITIES: FIRST_PAGE, SCORES: FIRST_PAGE}
+        self.done = {ACTIVITIES: False, SCORES: not statsNeedScores(stats)}
+        if not self.done[SCORES]:
+            context.showScoreDict = {}
+
+    # Feeds one page of the score list or the activity feed, as AniList sent
+    # it. The media of an activity page are hydrated here, so a failed lookup
+    # leaves the page in the journal to be hydrated again.
+    def apply(self, kind, page, response, heavyFields):
+        if kind == SCORES:
+            addMediaRatings(self.context.showScoreDict, response)
+        else:
+            mediaStore = self.context.mediaStore
+            activities = [mediaStore.normalize(status) for status in pageStatuses(response)]
+            if heavyFields:
+                activities = list(hydrateActivities(activities, mediaStore, heavyFields))
+            feedAccumulators(self.context, self.accumulators, activities, self.columns, self.watchTime)
+        self.pages[kind] = page + 1
+        self.done[kind] = isLastPage(response, kind, page)
+
+    def result(self):
+        return wrappedResults(self.context, self.accumulators, self.columns, self.watchTime)
+
+class BatchJournal:
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = path
+        self.connection = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.connection is None:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            # A commit per page; in WAL mode without a sync on every commit it
+            # still survives the process being killed, and a power cut only
+            # loses the last pages, which are fetched again.
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    username TEXT PRIMARY KEY,
+                    job TEXT,
+                    status TEXT,
+                    checkpoint BLOB,
+                    report BLOB,
+                    error TEXT,
+                    attempts INTEGER,
+                    updated REAL
+                )''')
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS pages (
+                    username TEXT,
+                    kind TEXT,
+                    page INTEGER,
+                    body BLOB,
+                    PRIMARY KEY (username, kind, page)
+                )''')
+            self.connection.commit()
+        return self.connection
+
+    # (status, checkpoint, report, attempts) of the user in this job, or None.
+    def load(self, username, job):
+        with self.lock:
+            row = self.connect().execute('SELECT job, status, checkpoint, report, attempts FROM users WHERE username = ?', (username,)).fetchone()
+        if row is None or row[0] != job:
+            return None
+        try:
+            checkpoint = pickle.loads(row[2]) if row[2] is not None else None
+            report = pickle.loads(row[3]) if row[3] is not None else None
+        except Exception:
+            # Checkpoints written by an older version of the stats start over.
+            return None
+        return row[1], checkpoint, report, row[4]
+
+    # Journaled pages not yet in the checkpoint, as {(kind, page): response}.
+    def pages(self, username):
+        with self.lock:
+            rows = self.connect().execute('SELECT kind, page, body FROM pages WHERE username = ?', (username,)).fetchall()
+        return {(kind, page): pickle.loads(body) for kind, page, body in rows}
+
+    def addPage(self, username, kind, page, body):
+        data = pickle.dumps(body, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            connection = self.connect()
+            connection.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)', (username, kind, page, data))
+            connection.commit()
+
+    # Saves the first checkpoint of a user and drops any pages left from
+    # another job.
+    def start(self, username, job, checkpoint, attempts):
+        self.write(username, job, 'running', checkpoint, None, None, attempts)
+
+    # Saves the checkpoint and drops the pages it already includes. Pages
+    # fetched ahead of it are kept.
+    def snapshot(self, username, job, checkpoint, attempts):
+        self.write(username, job, 'running', checkpoint, None, None, attempts, checkpoint.pages)
+
+    def finish(self, username, job, report, attempts):
+        self.write(username, job, 'done', None, report, None, attempts)
+
+    # The checkpoint and pages of a failed user are kept for the next run.
+    def fail(self, username, job, error, attempts):
+        with self.lock:
+            connection = self.connect()
+            cursor = connection.execute('UPDATE users SET status = ?, error = ?, attempts = ?, updated = ? WHERE username = ? AND job = ?', ('failed', repr(error), attempts, time.time(), username, job))
+            if cursor.rowcount == 0:
+                connection.execute('INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (username, job, 'failed', None, None, repr(error), attempts, time.time()))
+            connection.commit()
+
+    def write(self, username, job, status, checkpoint, report, error, attempts, keepFrom=None):
+        checkpointData = pickle.dumps(checkpoint, pickle.HIGHEST_PROTOCOL) if checkpoint is not None else None
+        reportData = pickle.dumps(report, pickle.HIGHEST_PROTOCOL) if report is not None else None
+        with self.lock:
+            connection = self.connect()
+            connection.execute('INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (username, job, status, checkpointData, reportData, error, attempts, time.time()))
+            if keepFrom is None:
+                connection.execute('DELETE FROM pages WHERE username = ?', (username,))
+            else:
+                for kind, page in keepFrom.items():
+                    connection.execute('DELETE FROM pages WHERE username = ? AND kind = ? AND page < ?', (username, kind, page))
+            connection.commit()
+
+    # (username, status, error, attempts) of every user in the journal.
+    def summary(self):
+        with self.lock:
+            return self.connect().execute('SELECT username, status, error, attempts FROM users ORDER BY username').fetchall()
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+# Fetches a page from the journal, or from AniList and journals it from the
+# fetching thread, so pages fetched ahead are kept even if the user fails
+# before they are fed.
+def journaledFetch(journal, username, kind, journaled, query):
+    def fetchPage(page):
+        response = journaled.get((kind, page))
+        if response is None:
+            response = query(page)
+            if response.get('data') and 'errors' not in response:
+                journal.addPage(username, kind, page, response)
+        return response
+    return fetchPage
+
+# Builds one user's report, resuming from the journal when the user has been
+# started before. The score list is read before the activity feed, each page
+# journaled as soon as it arrives. A window still open is closed at the time
+# the user is first started, so activities logged while a long run is paused
+# do not shift the pages already journaled.
+def runUser(journal, username, stats, year, attempts, snapshotEvery=SNAPSHOT_EVERY):
+    window = yearWindow(year)
+    job = jobKey(stats, window)
+    saved = journal.load(username, job)
+    if saved is not None and saved[0] == 'done':
+        return saved[2]
+
+    checkpoint = saved[1] if saved is not None else None
+    if checkpoint is None:
+        pinned = (window[0], min(window[1], int(time.time())))
+        checkpoint = UserCheckpoint(WrappedContext(username, getUserIdFromUsername(username), year=year, window=pinned), stats)
+        journal.start(username, job, checkpoint, attempts)
+        journaled = {}
+    else:
+        journaled = journal.pages(username)
+
+    context = checkpoint.context
+    inlineFields, heavyFields = splitMediaFields(statsMediaFields(stats))
+    lists = {
+        SCORES: lambda page: queryMediaRatingPage(context.userId, page),
+        ACTIVITIES: lambda page: queryUserStatuses(context.userId, page, inlineFields, context.window),
+    }
+    unsaved = 0
+    for kind, query in lists.items():
+        if checkpoint.done[kind]:
+            continue
+        # The pages are fetched ahead as usual but fed in order, journaled pages
+        # first taken from the journal.
+        fetchPage = journaledFetch(journal, username, kind, journaled, query)
+        for page, response in enumerate(iterPages(fetchPage, kind, first=checkpoint.pages[kind], cachedPage=lambda page, kind=kind: journaled.get((kind, page))), checkpoint.pages[kind]):
+            checkpoint.apply(kind, page, response, heavyFields)
+            unsaved += 1
+            if unsaved >= snapshotEvery:
+                journal.snapshot(username, job, checkpoint, attempts)
+                unsaved = 0
+
+    report = checkpoint.result()
+    journal.finish(username, job, report, attempts)
+    return report
+
+# Generates reports for many users on a pool of workers threads, yielding
+# (username, report) pairs as each user finishes and the exception in place of
+# the report for a user that still fails after maxAttempts tries. Each try
+# carries on from the journal where the last one stopped.
+def journaledBatch(usernames, stats=None, year=DEFAULT_YEAR, journal=None, workers=DEFAULT_WORKERS, maxAttempts=DEFAULT_MAX_ATTEMPTS, snapshotEvery=SNAPSHOT_EVERY):
+
+    if stats is None:
+        stats = list(STATS.keys())
+    if journal is None:
+        journal = BatchJournal()
+
+    AnilistFetch.configureSession(workers * AnilistPaging.lookAhead)
+
+    def runWithRetries(username):
+        for attempt in range(1, maxAttempts + 1):
+            try:
+                return runUser(journal, username, stats, year, attempt, snapshotEvery)
+            except Exception as e:
+                error = e
+                if attempt < maxAttempts:
+                    time.sleep(backoffSeconds(attempt - 1))
+        journal.fail(username, jobKey(stats, yearWindow(year)), error, maxAttempts)
+        return error
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='anilist-journal')
+    futures = {executor.submit(runWithRetries, username): username for username in usernames}
+    try:
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+def runJournaled(usernames, stats=None, year=DEFAULT_YEAR, journal=None, workers=DEFAULT_WORKERS, maxAttempts=DEFAULT_MAX_ATTEMPTS, snapshotEvery=SNAPSHOT_EVERY):
+    return dict(journaledBatch(usernames, stats, year, journal, workers, maxAttempts, snapshotEvery))
@@ -0,0 +1,170 @@
+import collections
+import json
+import threading
+import time
+
+# Timing spans and counters for finding where a report spends its time: every
+# GraphQL call, rate limit wait, decode, stat and chart render is a span, and
+# cache hits, retries and score misses are counters. Recording is off by
+# default and costs one attribute check per call site while off.
+
+DEFAULT_MAX_EVENTS = 10000
+
+class Span:
+
+    __slots__ = ('name', 'label', 'fields', 'start', 'seconds')
+
+    def __init__(self, name, label, fields):
+        self.name = name
+        self.label = label
+        self.fields = fields
+        self.start = None
+        self.seconds = None
+
+    # Adds details only known once the work is done, e.g. the response size.
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        metrics.record(self)
+        return False
+
+class NoSpan:
+
+    def set(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NO_SPAN = NoSpan()
+
+class Metrics:
+
+    def __init__(self, maxEvents=DEFAULT_MAX_EVENTS):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.maxEvents = maxEvents
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # The most recent spans with all their fields, and per (name, label)
+            # totals over every span since the last reset.
+            self.events = collections.deque(maxlen=self.maxEvents)
+            self.spanCounts = collections.Counter()
+            self.spanSeconds = collections.Counter()
+            self.counters = collections.Counter()
+
+    # label is what the span is aggregated under (query type, stat or chart
+    # name); fields only go into the recorded event.
+    def span(self, name, label=None, **fields):
+        if not self.enabled:
+            return NO_SPAN
+        return Span(name, label, fields)
+
+    def record(self, span):
+        key = (span.name, span.label)
+        with self.lock:
+            self.spanCounts[key] += 1
+            self.spanSeconds[key] += span.seconds
+            self.events.append({'span': span.name, 'label': span.label, 'start': span.start, 'seconds': span.seconds, **span.fields})
+
+    # Adds time measured elsewhere, for work too fine-grained for a span each.
+    def addTime(self, name, label, seconds, count=1):
+        with self.lock:
+            self.spanCounts[(name, label)] += count
+            self.spanSeconds[(name, label)] += seconds
+
+    def count(self, name, label=None, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[(name, label)] += amount
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'spans': [{'span': name, 'label': label, 'count': self.spanCounts[(name, label)], 'seconds': self.spanSeconds[(name, label)]} for name, label in self.spanCounts],
+                'counters': [{'counter': name, 'label': label, 'value': value} for (name, label), value in self.counters.items()],
+                'events': list(self.events),
+            }
+
+    def toJson(self, indent=None):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    # Prometheus text exposition: spans as summaries without quantiles, counters
+    # as totals. Individual events are left out.
+    def toPrometheus(self, prefix='anilistwrapped'):
+        snapshot = self.snapshot()
+        lines = [
+            '# HELP ' + prefix + '_span_seconds Time spent per span.',
+            '# TYPE ' + prefix + '_span_seconds summary',
+        ]
+        for span in snapshot['spans']:
+            labels = prometheusLabels(span=span['span'], label=span['label'])
+            lines.append(prefix + '_span_seconds_sum' + labels + ' ' + repr(span['seconds']))
+            lines.append(prefix + '_span_seconds_count' + labels + ' ' + str(span['count']))
+
+        names = sorted({counter['counter'] for counter in snapshot['counters']})
+        for name in names:
+            lines.append('# TYPE ' + prefix + '_' + name + '_total counter')
+            for counter in snapshot['counters']:
+                if counter['counter'] == name:
+                    lines.append(prefix + '_' + name + '_total' + prometheusLabels(label=counter['label']) + ' ' + str(counter['value']))
+        return '\n'.join(lines) + '\n'
+
+def prometheusLabels(**labels):
+    pairs = [name + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"' for name, value in labels.items() if value is not None]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+metrics = Metrics()
+
+def configureMetrics(enabled=True, maxEvents=None):
+    if maxEvents is not None:
+        metrics.maxEvents = maxEvents
+    metrics.reset()
+    metrics.enabled = enabled
+
+# Runs function under cProfile, or pyinstrument when installed and asked for.
+# The report is written to output when given: cProfile's binary stats for a
+# .prof path, a text report otherwise. Returns the function's result and the
+# profiler.
+def profileCall(function, *args, profiler='cProfile', output=None, **kwargs):
+
+    if profiler == 'pyinstrument':
+        import pyinstrument
+
+        profile = pyinstrument.Profiler()
+        profile.start()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            profile.stop()
+        if output is not None:
+            with open(output, 'w') as file:
+                file.write(profile.output_text())
+        return result, profile
+
+    if profiler != 'cProfile':
+        raise Exception("Unknown profiler " + profiler + ".")
+
+    import cProfile
+    import pstats
+
+    profile = cProfile.Profile()
+    result = profile.runcall(function, *args, **kwargs)
+    if output is not None:
+        if output.endswith('.prof'):
+            profile.dump_stats(output)
+        else:
+            with open(output, 'w') as file:
+                pstats.Stats(profile, stream=file).sort_stats('cumulative').print_stats(50)
+    return result, profile
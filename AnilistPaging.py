@@ -0,0 +1,96 @@
+import collections
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# AniList numbers pages from 1 (page 0 is answered as page 1).
+FIRST_PAGE = 1
+
+DEFAULT_LOOK_AHEAD = 4
+
+lookAhead = DEFAULT_LOOK_AHEAD
+pageExecutor = None
+pageExecutorLock = threading.Lock()
+
+def getPageExecutor():
+    global pageExecutor
+
+    with pageExecutorLock:
+        if pageExecutor is None:
+            pageExecutor = ThreadPoolExecutor(max_workers=lookAhead, thread_name_prefix='anilist-page')
+        return pageExecutor
+
+# Sets how many pages are requested ahead of the one being consumed. 1 pages
+# strictly one request at a time.
+def configurePaging(pages):
+    global lookAhead, pageExecutor
+
+    with pageExecutorLock:
+        lookAhead = max(1, pages)
+        if pageExecutor is not None:
+            pageExecutor.shutdown(wait=False)
+            pageExecutor = None
+
+def pageItems(response, field):
+    return response['data']['Page'][field]
+
+# pageInfo.lastPage is only trusted when the query asked for it; the activity
+# feed does not report a reliable one.
+def lastPageOf(response):
+    return response['data']['Page']['pageInfo'].get('lastPage')
+
+def isLastPage(response, field, page):
+    pageInfo = response['data']['Page']['pageInfo']
+    lastPage = pageInfo.get('lastPage')
+    return not pageItems(response, field) or not pageInfo['hasNextPage'] or (lastPage is not None and page >= lastPage)
+
+# Yields the responses of fetchPage(first), fetchPage(first + 1), ... in page
+# order while the following pages are already being fetched on the page
+# executor. When the first page reports lastPage only the pages up to it are
+# requested, otherwise up to lookAhead pages are requested speculatively past
+# the one being read and the ones past the end are dropped. Paging stops at the
+# first empty page or the first page without a next page.
+#
+# cachedPage(page), when given, returns a page already stored locally (or None)
+# without a request. Stored pages are taken inline before anything is requested
+# past them, so a stored last page ends the look-ahead and the end of a cached
+# feed costs no requests.
+def iterPages(fetchPage, field, pages=None, first=FIRST_PAGE, cachedPage=None):
+
+    if pages is None:
+        pages = lookAhead
+
+    response = fetchPage(first)
+    yield response
+    if isLastPage(response, field, first):
+        return
+
+    lastPage = lastPageOf(response)
+    executor = getPageExecutor()
+    pending = collections.deque()
+    nextPage = first + 1
+
+    try:
+        while True:
+            while len(pending) < pages and (lastPage is None or nextPage <= lastPage):
+                response = cachedPage(nextPage) if cachedPage is not None else None
+                if response is None:
+                    future = executor.submit(fetchPage, nextPage)
+                else:
+                    future = Future()
+                    future.set_result(response)
+                    if isLastPage(response, field, nextPage):
+                        lastPage = nextPage
+                pending.append((nextPage, future))
+                nextPage += 1
+
+            if not pending:
+                return
+
+            page, future = pending.popleft()
+            response = future.result()
+            yield response
+            if isLastPage(response, field, page):
+                return
+    finally:
+        for page, future in pending:
+            future.cancel()
@@ -0,0 +1,148 @@
+import collections
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from AnilistStore import ActivityRecord, MediaRecord, MediaStore
+from AnilistStats import WrappedContext, STATS, computeWrapped, statsNeedScores
+
+# Stat computation for many users spread over a pool of worker processes. The
+# activities and scores a report needs are already fetched; they are packed
+# into a few flat arrays per user, and every media record is sent once per
+# chunk of users however many of them watched it, so pickling stays cheap.
+
+DEFAULT_CHUNK_SIZE = 8
+
+# None does not fit the integer columns and is stored as -1; ids, timestamps
+# and episode numbers are never negative.
+MISSING = -1
+
+def packOptional(value):
+    return MISSING if value is None else value
+
+def unpackOptional(value):
+    return None if value == MISSING else value
+
+# Status and type strings become indices into a per-user table of the distinct
+# values, which is a handful of entries.
+def packStrings(values):
+    table = {}
+    codes = array('B', (table.setdefault(value, len(table)) for value in values))
+    return tuple(table), codes
+
+def packActivities(activities):
+    return (
+        array('q', (packOptional(activity.id) for activity in activities)),
+        packStrings(activity.type for activity in activities),
+        packStrings(activity.status for activity in activities),
+        array('l', (packOptional(activity.progressStart) for activity in activities)),
+        array('l', (packOptional(activity.progressEnd) for activity in activities)),
+        array('q', (packOptional(activity.createdAt) for activity in activities)),
+        array('q', (activity.mediaId for activity in activities)),
+    )
+
+def unpackActivities(packed):
+    ids, (types, typeCodes), (statuses, statusCodes), progressStarts, progressEnds, createdAts, mediaIds = packed
+    return [ActivityRecord(unpackOptional(ids[i]), types[typeCodes[i]], statuses[statusCodes[i]], unpackOptional(progressStarts[i]), unpackOptional(progressEnds[i]), unpackOptional(createdAts[i]), mediaIds[i]) for i in range(len(ids))]
+
+def packMedia(media):
+    return tuple(getattr(media, field) for field in MediaRecord.__slots__)
+
+def unpackMedia(packed):
+    media = MediaRecord(packed[0])
+    for field, value in zip(MediaRecord.__slots__, packed):
+        setattr(media, field, value)
+    return media
+
+def packScores(showScoreDict):
+    if showScoreDict is None:
+        return None
+    return array('q', showScoreDict.keys()), array('d', showScoreDict.values())
+
+def unpackScores(packed):
+    if packed is None:
+        return None
+    return {mediaId: int(score) if score.is_integer() else score for mediaId, score in zip(*packed)}
+
+# One user's input: the report settings, the packed activities and scores, and
+# the favourites when they are known.
+def packUser(context, activities):
+    return (context.username, context.userId, context.year, context.window, packActivities(activities), packScores(context.showScoreDict), context.favorites)
+
+# Packs the (context, activities) pairs of a chunk of users with the media
+# records they refer to, each one once.
+def packChunk(inputs, stats):
+    mediaTable = {}
+    users = []
+    for context, activities in inputs:
+        for activity in activities:
+            if activity.mediaId not in mediaTable:
+                mediaTable[activity.mediaId] = packMedia(context.mediaStore[activity.mediaId])
+        users.append(packUser(context, activities))
+    return stats, tuple(mediaTable.values()), users
+
+# Runs in the worker: rebuilds the media store and every user's report. A
+# user whose report fails comes back with the exception instead.
+def computeChunk(chunk):
+    stats, mediaTable, users = chunk
+
+    mediaStore = MediaStore()
+    for packed in mediaTable:
+        media = unpackMedia(packed)
+        mediaStore.media[media.id] = media
+        mediaStore.hydrated.add(media.id)
+
+    reports = []
+    for username, userId, year, window, activities, scores, favorites in users:
+        try:
+            context = WrappedContext(username, userId, unpackScores(scores), mediaStore, year, window, favorites)
+            reports.append((username, computeWrapped(context, unpackActivities(activities), stats)))
+        except Exception as e:
+            reports.append((username, e))
+    return reports
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# Computes the reports of already fetched users, given as (context, activities)
+# pairs, on a pool of processes, chunkSize users per task. Score lists the
+# stats need are fetched here first when a context does not have one yet; the
+# favoriteFive tiebreak still asks AniList for favourites from the worker.
+# Only two chunks per process are packed ahead, so inputs can be a generator
+# over a whole community. Yields (username, report) pairs in input order.
+def computeBatch(inputs, stats=None, processes=None, chunkSize=DEFAULT_CHUNK_SIZE, executor=None):
+
+    if stats is None:
+        stats = list(STATS.keys())
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    ownExecutor = executor is None
+    if ownExecutor:
+        executor = ProcessPoolExecutor(max_workers=processes)
+
+    pending = collections.deque()
+    try:
+        for chunk in chunked(inputs, chunkSize):
+            if statsNeedScores(stats):
+                for context, activities in chunk:
+                    context.getScores()
+            pending.append(executor.submit(computeChunk, packChunk(chunk, stats)))
+
+            if len(pending) >= processes * 2:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        if ownExecutor:
+            executor.shutdown()
@@ -0,0 +1,70 @@
+import random
+import threading
+import time
+
+# AniList allows 90 requests per minute per client.
+DEFAULT_REQUESTS_PER_MINUTE = 90
+
+# Client-wide token bucket. Callers reserve a token and wait until it is theirs,
+# so tokens may go negative while requests are queued; waiting that way keeps
+# threads in arrival order without polling. The async batch sends its requests
+# from threads too, so it shares the same bucket. The bucket also follows the
+# X-RateLimit-* and Retry-After headers AniList sends back.
+class TokenBucket:
+
+    def __init__(self, requestsPerMinute=DEFAULT_REQUESTS_PER_MINUTE):
+        self.lock = threading.Lock()
+        self.setLimit(requestsPerMinute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def setLimit(self, requestsPerMinute):
+        self.capacity = requestsPerMinute
+        self.rate = requestsPerMinute / 60
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Takes a token and returns how many seconds the caller must wait before using it.
+    def reserve(self):
+        with self.lock:
+            self.refill(time.monotonic())
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    # Holds every caller back for the given number of seconds, e.g. after a 429.
+    def pause(self, seconds):
+        with self.lock:
+            self.refill(time.monotonic())
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+    def update(self, headers):
+        limit = headers.get('X-RateLimit-Limit')
+        remaining = headers.get('X-RateLimit-Remaining')
+        with self.lock:
+            if limit is not None and int(limit) > 0 and int(limit) != self.capacity:
+                self.setLimit(int(limit))
+            if remaining is not None:
+                self.refill(time.monotonic())
+                self.tokens = min(self.tokens, int(remaining))
+
+def retryAfterSeconds(headers):
+    retryAfter = headers.get('Retry-After')
+    if retryAfter is None:
+        return None
+    try:
+        return float(retryAfter)
+    except ValueError:
+        return None
+
+# Exponential backoff with full jitter, in seconds.
+def backoffSeconds(attempt, base=1, cap=60):
+    return random.uniform(0, min(cap, base * 2 ** attempt))
@@ -0,0 +1,323 @@
+import argparse
+import asyncio
+import collections
+import http
+import json
+import math
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from AnilistMetrics import metrics
+from AnilistFetch import DEFAULT_YEAR
+from AnilistStats import STATS, PARTIAL_EVERY, buildWrapped
+
+# A small HTTP service for Wrapped reports, on plain asyncio streams:
+#
+#   GET /wrapped/<username>?year=2023               the full report as JSON
+#   GET /wrapped/<username>/stream?year=2023        NDJSON: partial results while
+#                                                   the history is read, then
+#                                                   the report
+#   GET /wrapped/<username>/<chart>.png?year=2023   a chart (png or svg)
+#   GET /metrics                                    Prometheus metrics
+#
+# Requests for a user whose report is already being computed wait on that
+# computation instead of starting another one, and finished reports and charts
+# are kept for ttl seconds, so a burst of page views costs one fetch per user.
+
+DEFAULT_TTL = 15 * 60
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_WORKERS = 8
+CHART_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# Least recently used entries beyond maxEntries are dropped as well as expired
+# ones.
+class ResultCache:
+
+    def __init__(self, ttl=DEFAULT_TTL, maxEntries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.maxEntries = maxEntries
+        self.entries = collections.OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+# One in-flight report. Partial results are kept so that a stream joining late
+# still sees every update; waiters are woken through an event that is replaced
+# after every update.
+class ReportJob:
+
+    def __init__(self, loop):
+        self.future = loop.create_future()
+        self.partials = []
+        self.updated = asyncio.Event()
+
+    def wake(self):
+        self.updated.set()
+        self.updated = asyncio.Event()
+
+    def publish(self, count, results):
+        self.partials.append({'activities': count, 'partial': results})
+        self.wake()
+
+    def finish(self, task):
+        if task.exception() is not None:
+            self.future.set_exception(task.exception())
+        else:
+            self.future.set_result(task.result())
+        self.wake()
+
+    # Yields the partial results as they come; the report is in self.future
+    # once this returns.
+    async def iterPartials(self):
+        position = 0
+        while True:
+            updated = self.updated
+            while position < len(self.partials):
+                yield self.partials[position]
+                position += 1
+            if self.future.done():
+                return
+            await updated.wait()
+
+class WrappedService:
+
+    def __init__(self, stats=None, ttl=DEFAULT_TTL, maxEntries=DEFAULT_MAX_ENTRIES, workers=DEFAULT_WORKERS, chartProcesses=1, partialEvery=PARTIAL_EVERY):
+        self.stats = stats if stats is not None else list(STATS.keys())
+        self.cache = ResultCache(ttl, maxEntries)
+        self.inFlight = {}
+        self.partialEvery = partialEvery
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wrapped-service')
+        self.chartProcesses = chartProcesses
+        self.chartExecutor = None
+        self.chartLock = threading.Lock()
+
+    # AniList usernames are case insensitive.
+    def reportKey(self, username, year):
+        return ('report', username.lower(), year)
+
+    # The in-flight computation of a report, started if there is none.
+    def reportJob(self, username, year):
+        key = self.reportKey(username, year)
+        job = self.inFlight.get(key)
+        if job is not None:
+            return job
+
+        loop = asyncio.get_running_loop()
+        job = ReportJob(loop)
+        self.inFlight[key] = job
+        metrics.count('serviceComputations')
+
+        def onPartial(count, results):
+            loop.call_soon_threadsafe(job.publish, count, results)
+
+        def done(task):
+            del self.inFlight[key]
+            if task.exception() is None:
+                self.cache.put(key, task.result())
+            job.finish(task)
+
+        task = loop.run_in_executor(self.executor, lambda: buildWrapped(username, self.stats, year, onPartial=onPartial, partialEvery=self.partialEvery))
+        asyncio.ensure_future(task).add_done_callback(done)
+        return job
+
+    async def report(self, username, year=DEFAULT_YEAR):
+        report = self.cache.get(self.reportKey(username, year))
+        if report is not None:
+            metrics.count('serviceCacheHits', 'report')
+            return report
+        return await asyncio.shield(self.reportJob(username, year).future)
+
+    # Charts are rendered in a separate process, since the renderer keeps one
+    # figure per process and rendering would otherwise hold up the event loop.
+    def getChartExecutor(self):
+        with self.chartLock:
+            if self.chartExecutor is None:
+                self.chartExecutor = ProcessPoolExecutor(max_workers=self.chartProcesses)
+            return self.chartExecutor
+
+    async def chart(self, username, chart, format, year=DEFAULT_YEAR):
+        key = ('chart', username.lower(), year, chart, format)
+        image = self.cache.get(key)
+        if image is not None:
+            metrics.count('serviceCacheHits', 'chart')
+            return image
+
+        job = self.inFlight.get(key)
+        if job is None:
+            job = asyncio.ensure_future(self.renderChart(key, username, chart, format, year))
+            self.inFlight[key] = job
+        return await asyncio.shield(job)
+
+    async def renderChart(self, key, username, chart, format, year):
+        from AnilistCharts import renderJob
+
+        try:
+            report = await self.report(username, year)
+            loop = asyncio.get_running_loop()
+            image = await loop.run_in_executor(self.getChartExecutor(), renderJob, (chart, username, report[chart], year, None, format))
+            self.cache.put(key, image)
+            return image
+        finally:
+            del self.inFlight[key]
+
+    async def handle(self, reader, writer):
+        try:
+            requestLine = await reader.readline()
+            if not requestLine:
+                return
+            while (await reader.readline()).strip():
+                pass
+
+            parts = requestLine.decode('latin-1').split()
+            if len(parts) != 3:
+                await respondJson(writer, 400, {'error': 'Malformed request.'})
+                return
+            if parts[0] != 'GET':
+                await respondJson(writer, 405, {'error': 'Only GET is supported.'})
+                return
+            metrics.count('serviceRequests')
+            await self.route(parts[1], writer)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, target, writer):
+        url = urllib.parse.urlsplit(target)
+        path = [urllib.parse.unquote(part) for part in url.path.split('/') if part]
+        query = urllib.parse.parse_qs(url.query)
+
+        if path == ['metrics']:
+            await respond(writer, 200, metrics.toPrometheus().encode('utf-8'), 'text/plain; version=0.0.4')
+            return
+        if len(path) < 2 or len(path) > 3 or path[0] != 'wrapped':
+            await respondJson(writer, 404, {'error': 'Not found.'})
+            return
+
+        try:
+            year = int(query.get('year', [DEFAULT_YEAR])[0])
+        except ValueError:
+            await respondJson(writer, 400, {'error': 'year must be a number.'})
+            return
+
+        username = path[1]
+        try:
+            if len(path) == 2:
+                await respondJson(writer, 200, await self.report(username, year))
+            elif path[2] == 'stream':
+                await self.stream(writer, username, year)
+            else:
+                import AnilistCharts
+
+                chart, _, format = path[2].rpartition('.')
+                if chart not in AnilistCharts.CHARTS or chart not in self.stats or format not in CHART_FORMATS:
+                    await respondJson(writer, 404, {'error': 'Not found.'})
+                    return
+                await respond(writer, 200, await self.chart(username, chart, format, year), CHART_FORMATS[format])
+        except Exception as e:
+            if str(e) == "Username does not exist.":
+                await respondJson(writer, 404, {'error': str(e)})
+            else:
+                await respondJson(writer, 502, {'error': str(e)})
+
+    # Heavy users get their stats as they are read. A cached report is sent as
+    # the only line; errors after the headers are sent end the stream with an
+    # error line.
+    async def stream(self, writer, username, year):
+        report = self.cache.get(self.reportKey(username, year))
+        if report is not None:
+            metrics.count('serviceCacheHits', 'stream')
+            await respond(writer, 200, dumpLine({'report': report}), 'application/x-ndjson')
+            return
+
+        job = self.reportJob(username, year)
+        writeHead(writer, 200, 'application/x-ndjson', {'Transfer-Encoding': 'chunked'})
+        async for partial in job.iterPartials():
+            await writeChunk(writer, dumpLine(partial))
+        try:
+            await writeChunk(writer, dumpLine({'report': job.future.result()}))
+        except Exception as e:
+            await writeChunk(writer, dumpLine({'error': str(e)}))
+        await writeChunk(writer, b'')
+
+    async def start(self, host='127.0.0.1', port=8080):
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        if self.chartExecutor is not None:
+            self.chartExecutor.shutdown(wait=False)
+
+# NaN and infinity are not JSON; they are sent as null.
+def finite(value):
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [finite(item) for item in value]
+    return value
+
+def dumpJson(value):
+    return json.dumps(finite(value), allow_nan=False).encode('utf-8')
+
+def dumpLine(value):
+    return dumpJson(value) + b'\n'
+
+def writeHead(writer, status, contentType, headers):
+    lines = ['HTTP/1.1 ' + str(status) + ' ' + http.HTTPStatus(status).phrase, 'Content-Type: ' + contentType, 'Connection: close']
+    lines += [name + ': ' + str(value) for name, value in headers.items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+async def writeChunk(writer, data):
+    writer.write(format(len(data), 'x').encode('latin-1') + b'\r\n' + data + b'\r\n')
+    await writer.drain()
+
+async def respond(writer, status, body, contentType):
+    writeHead(writer, status, contentType, {'Content-Length': len(body)})
+    writer.write(body)
+    await writer.drain()
+
+async def respondJson(writer, status, value):
+    await respond(writer, status, dumpJson(value), 'application/json')
+
+async def serve(host, port, service):
+    server = await service.start(host, port)
+    print('Serving Wrapped on http://' + host + ':' + str(server.sockets[0].getsockname()[1]))
+    async with server:
+        await server.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve Wrapped reports over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--ttl', type=float, default=DEFAULT_TTL, help='seconds a finished report is kept')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='reports computed at once')
+    args = parser.parse_args()
+
+    service = WrappedService(ttl=args.ttl, workers=args.workers)
+    try:
+        asyncio.run(serve(args.host, args.port, service))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
@@ -0,0 +1,469 @@
+import collections
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from AnilistStore import MediaStore
+from AnilistFranchise import mediaClassifier
+from AnilistMetrics import metrics
+from AnilistFetch import DEFAULT_YEAR, yearWindow, getUserIdFromUsername, queryUserFavorites, queryMediaRating, iterProjectedActivities
+
+# The stat accumulators and the single-pass engine that feeds them. The score
+# columns need NumPy, which is only imported once a report asks for them.
+
+PARTIAL_EVERY = 500
+
+def isWatchStatus(activity):
+    return activity.status == 'watched episode' or activity.status == 'rewatched episode' or activity.status == 'rewatched' or (activity.status == 'completed' and activity.type == 'ANIME_LIST')
+
+scoreExecutor = None
+scoreExecutorLock = threading.Lock()
+
+def getScoreExecutor():
+    global scoreExecutor
+
+    with scoreExecutorLock:
+        if scoreExecutor is None:
+            scoreExecutor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='anilist-scores')
+        return scoreExecutor
+
+# Shared state for one report: the user is resolved once, the score list is
+# only fetched if some stat asks for it, and media metadata is kept once per id
+# in mediaStore. The report covers activities created inside window, which
+# defaults to the given year.
+class WrappedContext:
+
+    def __init__(self, username, userId=None, showScoreDict=None, mediaStore=None, year=DEFAULT_YEAR, window=None, favorites=None):
+        self.username = username
+        self.year = year
+        self.window = window if window is not None else yearWindow(year)
+        self.userId = userId if userId is not None else getUserIdFromUsername(username)
+        self.showScoreDict = showScoreDict
+        self.mediaStore = mediaStore if mediaStore is not None else MediaStore()
+        self.columns = None
+        self.watchTime = None
+        self.scoreFuture = None
+        # Ids of the user's favourite anime, only asked for when top five scores tie.
+        self.favorites = favorites
+
+    # Starts paging the score list in the background so the activity stream can
+    # be consumed meanwhile; getScores() waits for it.
+    def prefetchScores(self):
+        if self.showScoreDict is None and self.scoreFuture is None:
+            self.scoreFuture = getScoreExecutor().submit(queryMediaRating, self.userId)
+
+    def getScores(self):
+        if self.showScoreDict is None:
+            if self.scoreFuture is not None:
+                self.showScoreDict = self.scoreFuture.result()
+            else:
+                self.showScoreDict = queryMediaRating(self.userId)
+        return self.showScoreDict
+
+# Stat accumulators. Each one is fed every activity of the stream together with
+# its media record through add() and produces its value from result(), so any
+# set of them can share a single pass over the pages. Scores are only looked up
+# in result(), so the activities can be consumed while the score list is still
+# being fetched.
+class DaysWatchedStat:
+
+    mediaFields = ('duration', 'episodes')
+    needsWatchTime = True
+
+    def __init__(self, context):
+        self.context = context
+
+    def add(self, activity, media):
+        pass
+
+    def result(self):
+        return self.context.watchTime.total()/60/24
+
+class RewatchDaysStat(DaysWatchedStat):
+
+    def result(self):
+        return self.context.watchTime.rewatchTotal()/60/24
+
+# First watches of shows that aired this year, sequels and movies left out.
+# Season, format and prequels come from the shared classifier, which looks up
+# the shows it has not seen in batches.
+class SeasonalDaysStat(DaysWatchedStat):
+
+    needsLookups = True
+
+    def result(self):
+        watchTime = self.context.watchTime
+        watched = [(mediaId, minutes) for mediaId, minutes in zip(watchTime.mediaIds, watchTime.mediaWatchMinutes.tolist()) if minutes]
+        classes = mediaClassifier.lookup([mediaId for mediaId, minutes in watched], self.context.mediaStore)
+        minutes_watched = 0
+        for mediaId, minutes in watched:
+            mediaClass = classes.get(mediaId)
+            if mediaClass is not None and mediaClass.seasonYear == self.context.year and mediaClass.format != 'MOVIE' and not mediaClass.isSequel:
+                minutes_watched += minutes
+        return minutes_watched/60/24
+
+class BusiestDayStat(DaysWatchedStat):
+
+    def result(self):
+        return self.context.watchTime.busiestDay()
+
+class BusiestMonthStat(DaysWatchedStat):
+
+    def result(self):
+        return self.context.watchTime.busiestMonth()
+
+class FavoriteFiveStat:
+
+    mediaFields = ('title',)
+    needsScores = True
+
+    def __init__(self, context):
+        self.context = context
+        # Watched shows in the order they were first seen, which settles ties.
+        self.shows = {}
+
+    def add(self, activity, media):
+        if isWatchStatus(activity):
+            self.shows[media.id] = None
+
+    def result(self):
+        allMediaScoreDict = self.context.getScores()
+        mediaScoreDict = {mediaId: allMediaScoreDict[mediaId] for mediaId in self.shows if mediaId in allMediaScoreDict}
+        # Watched shows that are not on the user's list at all.
+        metrics.count('scoreMisses', 'favoriteFive', len(self.shows) - len(mediaScoreDict))
+        return [self.context.mediaStore[mediaId].title for mediaId in filterTopFive(mediaScoreDict, self.context.userId, self.context.favorites)]
+
+class FavoriteGenreStat:
+
+    mediaFields = ('title', 'genres')
+    needsScores = True
+
+    def __init__(self, context):
+        self.context = context
+        # Shows of every genre in the order they were first watched.
+        self.genreShows = collections.defaultdict(list)
+        self.shows = set()
+
+    def add(self, activity, media):
+        if media.id not in self.shows and isWatchStatus(activity):
+            self.shows.add(media.id)
+            for item in media.genres:
+                self.genreShows[item].append(media.id)
+
+    # Every genre is reported with its highest scored show, the first watched one
+    # on ties, and its number of shows.
+    def result(self):
+        allMediaScoreDict = self.context.getScores()
+        genreShows = sorted(self.genreShows.items(), key=lambda item: -len(item[1]))
+        return {genre: [self.context.mediaStore[max(shows, key=lambda mediaId: allMediaScoreDict.get(mediaId, 0))].title, len(shows)] for genre, shows in genreShows}
+
+class FavoriteStudioStat:
+
+    mediaFields = ('studios',)
+
+    def __init__(self, context):
+        self.studioCounts = collections.Counter()
+        self.shows = set()
+
+    def add(self, activity, media):
+        if media.id not in self.shows and isWatchStatus(activity):
+            self.shows.add(media.id)
+            self.studioCounts.update(media.studios)
+
+    def result(self):
+        if not self.studioCounts:
+            return None
+        return self.studioCounts.most_common(1)[0][0]
+
+# Ties go to the show that comes first in the feed.
+class MostTimeSpentWatchingShowStat(DaysWatchedStat):
+
+    mediaFields = ('title', 'duration', 'episodes')
+
+    def result(self):
+        watchTime = self.context.watchTime
+        if not len(watchTime.mediaIds):
+            return None
+        return self.context.mediaStore[watchTime.mediaIds[int(watchTime.mediaMinutes().argmax())]].title
+
+class FavoriteTagStat:
+
+    mediaFields = ('tags',)
+    tagType = None
+
+    def __init__(self, context):
+        self.tagDict = collections.Counter()
+        self.shows = set()
+
+    def add(self, activity, media):
+        if media.id not in self.shows and isWatchStatus(activity):
+            self.shows.add(media.id)
+            for name, category, rank in media.tags:
+                if (category[0:6] == "Theme-" and self.tagType == "Theme") or (category[0:11] == "Cast-Traits" and self.tagType == "Cast") or (category[0:4] == "Demo" and self.tagType == "Demo"):
+                    self.tagDict[name] += rank
+
+    def result(self):
+        if self.tagType == "Demo":
+            if not self.tagDict:
+                return None
+            return self.tagDict.most_common(1)[0][0]
+        return [x[0] for x in self.tagDict.most_common(3)]
+
+class FavoriteThemeStat(FavoriteTagStat):
+    tagType = "Theme"
+
+class FavoriteCastStat(FavoriteTagStat):
+    tagType = "Cast"
+
+class FavoriteDemoStat(FavoriteTagStat):
+    tagType = "Demo"
+
+# Score stats are computed from the per-show columns (AnilistColumns) that
+# computeWrapped fills once per report for every stat with needsColumns set.
+class ControversyScoreStat:
+
+    mediaFields = ('averageScore', 'duration')
+    needsScores = True
+    needsColumns = True
+
+    def __init__(self, context):
+        self.context = context
+
+    def add(self, activity, media):
+        pass
+
+    def result(self):
+        from AnilistColumns import meanAbsoluteDeviation
+        return meanAbsoluteDeviation(self.context.columns)
+
+class RatingBiasStat(ControversyScoreStat):
+
+    def result(self):
+        from AnilistColumns import signedBias
+        return signedBias(self.context.columns)
+
+class ScoreDistributionStat(ControversyScoreStat):
+
+    binWidth = 5
+
+    def result(self):
+        from AnilistColumns import scoreDistribution
+        return scoreDistribution(self.context.columns, self.binWidth)
+
+class ScorePercentilesStat(ControversyScoreStat):
+
+    def result(self):
+        from AnilistColumns import scorePercentiles
+        return scorePercentiles(self.context.columns)
+
+# Every stat a full report computes, keyed by the name it is reported under.
+STATS = {
+    'daysWatched': DaysWatchedStat,
+    'rewatchDays': RewatchDaysStat,
+    'daysWatchedSeasonals': SeasonalDaysStat,
+    'busiestDay': BusiestDayStat,
+    'busiestMonth': BusiestMonthStat,
+    'favoriteFive': FavoriteFiveStat,
+    'favoriteGenre': FavoriteGenreStat,
+    'favoriteStudio': FavoriteStudioStat,
+    'mostTimeSpentWatchingShow': MostTimeSpentWatchingShowStat,
+    'favoriteThemes': FavoriteThemeStat,
+    'favoriteCast': FavoriteCastStat,
+    'favoriteDemo': FavoriteDemoStat,
+    'controversyScore': ControversyScoreStat,
+    'ratingBias': RatingBiasStat,
+    'scoreDistribution': ScoreDistributionStat,
+    'scorePercentiles': ScorePercentilesStat,
+}
+
+def statsNeedScores(stats):
+    return any(getattr(STATS[name], 'needsScores', False) for name in stats)
+
+def statsNeedColumns(stats):
+    return any(getattr(STATS[name], 'needsColumns', False) for name in stats)
+
+def statsNeedWatchTime(stats):
+    return any(getattr(STATS[name], 'needsWatchTime', False) for name in stats)
+
+def statsMediaFields(stats):
+    mediaFields = set()
+    for name in stats:
+        mediaFields.update(STATS[name].mediaFields)
+    return mediaFields
+
+# Activity stream carrying exactly the media fields the given stats read.
+def iterWrappedActivities(userId, mediaStore, stats, window=None):
+    return iterProjectedActivities(userId, mediaStore, statsMediaFields(stats), window)
+
+def newColumnBuilder(context, stats):
+    if not statsNeedColumns(stats):
+        return None
+    from AnilistColumns import ColumnBuilder
+    return ColumnBuilder()
+
+def newWatchTimeBuilder(context, stats):
+    if not statsNeedWatchTime(stats):
+        return None
+    from AnilistWatchTime import WatchTimeBuilder
+    return WatchTimeBuilder(context.window)
+
+def newAccumulators(context, stats):
+    return {name: STATS[name](context) for name in stats}
+
+def feedAccumulators(context, accumulators, activities, columns=None, watchTime=None):
+    if metrics.enabled:
+        return feedAccumulatorsTimed(context, accumulators, activities, columns, watchTime)
+
+    for activity in activities:
+        media = context.mediaStore[activity.mediaId]
+        for accumulator in accumulators.values():
+            accumulator.add(activity, media)
+        if columns is not None and isWatchStatus(activity):
+            columns.add(activity, media)
+        if watchTime is not None:
+            watchTime.add(activity, media)
+
+# The same loop with the time spent in every accumulator summed per stat, so
+# the time waiting on pages is not counted against the stats.
+def feedAccumulatorsTimed(context, accumulators, activities, columns, watchTime):
+    clock = time.perf_counter
+    seconds = dict.fromkeys(accumulators, 0.0)
+    columnSeconds = 0.0
+    watchTimeSeconds = 0.0
+    count = 0
+
+    for activity in activities:
+        media = context.mediaStore[activity.mediaId]
+        for name, accumulator in accumulators.items():
+            start = clock()
+            accumulator.add(activity, media)
+            seconds[name] += clock() - start
+        if columns is not None and isWatchStatus(activity):
+            start = clock()
+            columns.add(activity, media)
+            columnSeconds += clock() - start
+        if watchTime is not None:
+            start = clock()
+            watchTime.add(activity, media)
+            watchTimeSeconds += clock() - start
+        count += 1
+
+    for name in accumulators:
+        metrics.addTime('statAdd', name, seconds[name], count)
+    if columns is not None:
+        metrics.addTime('statAdd', 'columns', columnSeconds, count)
+    if watchTime is not None:
+        metrics.addTime('statAdd', 'watchTime', watchTimeSeconds, count)
+
+def wrappedResults(context, accumulators, columns=None, watchTime=None):
+    if watchTime is not None:
+        with metrics.span('statResult', 'watchTime'):
+            context.watchTime = watchTime.finish()
+
+    if columns is not None:
+        with metrics.span('statResult', 'columns'):
+            showScoreDict = context.getScores()
+            context.columns = columns.finish(showScoreDict)
+        metrics.count('scoreMisses', 'columns', sum(1 for mediaId in columns.mediaIds if mediaId not in showScoreDict))
+
+    results = {}
+    for name, accumulator in accumulators.items():
+        with metrics.span('statResult', name):
+            results[name] = accumulator.result()
+    return results
+
+# Results so far of the stats that need neither scores nor media lookups, for
+# reporting progress on a long history; a stat with nothing to report yet is
+# None.
+def partialResults(context, accumulators, watchTime=None):
+    if watchTime is not None:
+        context.watchTime = watchTime.finish()
+
+    results = {}
+    for name, accumulator in accumulators.items():
+        if getattr(accumulator, 'needsScores', False) or getattr(accumulator, 'needsLookups', False):
+            continue
+        try:
+            results[name] = accumulator.result()
+        except (IndexError, ValueError):
+            results[name] = None
+    return results
+
+# onPartial, when given, is called with the number of activities read and the
+# partial results after every partialEvery activities.
+def computeWrapped(context, activities, stats=None, onPartial=None, partialEvery=PARTIAL_EVERY):
+
+    if stats is None:
+        stats = list(STATS.keys())
+
+    accumulators = newAccumulators(context, stats)
+    columns = newColumnBuilder(context, stats)
+    watchTime = newWatchTimeBuilder(context, stats)
+
+    if onPartial is None:
+        feedAccumulators(context, accumulators, activities, columns, watchTime)
+    else:
+        activities = iter(activities)
+        count = 0
+        while True:
+            batch = list(itertools.islice(activities, partialEvery))
+            if not batch:
+                break
+            feedAccumulators(context, accumulators, batch, columns, watchTime)
+            count += len(batch)
+            onPartial(count, partialResults(context, accumulators, watchTime))
+    return wrappedResults(context, accumulators, columns, watchTime)
+
+def buildWrapped(username, stats=None, year=DEFAULT_YEAR, window=None, onPartial=None, partialEvery=PARTIAL_EVERY):
+
+    if stats is None:
+        stats = list(STATS.keys())
+
+    context = WrappedContext(username, year=year, window=window)
+    if statsNeedScores(stats):
+        context.prefetchScores()
+    return computeWrapped(context, iterWrappedActivities(context.userId, context.mediaStore, stats, context.window), stats, onPartial, partialEvery)
+
+def filterTopFive(mediaScoreDict, userId, favoritesList=None):
+    topFive = heapq.nlargest(5, mediaScoreDict.items(), key=lambda item: item[1])
+    if len(topFive) < 5:
+        return [item[0] for item in topFive]
+
+    # Shows tied with the fifth best score all make the cut and are settled below.
+    cutoff = topFive[-1][1]
+    topFiveScores = dict(sorted([item for item in mediaScoreDict.items() if item[1] >= cutoff], key=lambda item: -item[1]))
+    topFiveShowsArr = list(topFiveScores.keys())
+
+    if len(topFiveShowsArr) > 5:
+        newTopFive = []
+        tiebreaks = set()
+        favorites = []
+        if favoritesList is None:
+            favoritesList = [x['id'] for x in queryUserFavorites(userId)['data']['User']['favourites']['anime']['nodes']]
+        for item in topFiveScores.items():
+            if item[1] > cutoff:
+                newTopFive.append(item[0])
+            else:
+                tiebreaks.add(item[0])
+
+        for item in favoritesList:
+            if item in tiebreaks:
+                favorites.append(item)
+        
+        if len(favorites) + len(newTopFive) == 5:
+            newTopFive.extend(favorites)
+        elif len(favorites) + len(newTopFive) < 5:
+            newTopFive.extend(favorites)
+
+            for item in topFiveScores.items():
+                if item[0] not in newTopFive and len(newTopFive) < 5:
+                    newTopFive.append(item[0])
+        else:
+            for item in favorites:
+                if len(newTopFive) < 5:
+                    newTopFive.append(item)
+
+        topFiveShowsArr = newTopFive
+
+    return topFiveShowsArr
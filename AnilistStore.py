@@ -0,0 +1,163 @@
+import collections
+import re
+import threading
+
+# Compact records for the activity stream. Activities keep only what the stats
+# read plus the id of their media, and every media is stored once in a
+# MediaStore no matter how many activities point at it.
+
+# Progress is an episode ("5") or a range ("3 - 7"), spaced or not.
+PROGRESS = re.compile(r'(\d+)(?:\s*-\s*(\d+))?')
+
+def parseProgress(progress):
+    if not progress:
+        return None, None
+    match = PROGRESS.search(progress)
+    if match is None:
+        return None, None
+    start = int(match.group(1))
+    return start, int(match.group(2)) if match.group(2) else start
+
+class ActivityRecord:
+
+    __slots__ = ('id', 'type', 'status', 'progressStart', 'progressEnd', 'createdAt', 'mediaId')
+
+    def __init__(self, id, type, status, progressStart, progressEnd, createdAt, mediaId):
+        self.id = id
+        self.type = type
+        self.status = status
+        self.progressStart = progressStart
+        self.progressEnd = progressEnd
+        self.createdAt = createdAt
+        self.mediaId = mediaId
+
+    def episodes(self):
+        if self.progressStart is None:
+            return 1
+        return 1 + self.progressEnd - self.progressStart
+
+class MediaRecord:
+
+    __slots__ = ('id', 'title', 'duration', 'episodes', 'seasonYear', 'format', 'averageScore', 'genres', 'tags', 'studios', 'relations', 'prequelId')
+
+    def __init__(self, id):
+        self.id = id
+        self.title = None
+        self.duration = 0
+        self.episodes = None
+        self.seasonYear = None
+        self.format = None
+        self.averageScore = None
+        self.genres = ()
+        self.tags = ()
+        self.studios = ()
+        # None until the relations have been fetched.
+        self.relations = None
+        self.prequelId = None
+
+    # Copies the fields present in a GraphQL media object, flattening the nested
+    # ones: studios keeps only animation studio names, tags become
+    # (name, category, rank) and relations their relation types, with the id of
+    # the anime prequel kept apart for franchise resolution.
+    def update(self, media):
+        if 'title' in media:
+            self.title = media['title']['romaji']
+        if 'duration' in media:
+            self.duration = media['duration'] or 0
+        if 'episodes' in media:
+            self.episodes = media['episodes']
+        if 'seasonYear' in media:
+            self.seasonYear = media['seasonYear']
+        if 'format' in media:
+            self.format = media['format']
+        if 'averageScore' in media:
+            self.averageScore = media['averageScore']
+        if 'genres' in media:
+            self.genres = tuple(media['genres'] or ())
+        if 'tags' in media:
+            self.tags = tuple((tag['name'], tag['category'], tag['rank']) for tag in media['tags'] or ())
+        if 'studios' in media:
+            self.studios = tuple(studio['name'] for studio in media['studios']['nodes'] if studio['isAnimationStudio'])
+        if 'relations' in media:
+            edges = media['relations']['edges']
+            self.relations = tuple(edge['relationType'] for edge in edges)
+            self.prequelId = next((edge['node']['id'] for edge in edges if edge['relationType'] == 'PREQUEL' and edge.get('node') and edge['node'].get('type') == 'ANIME'), None)
+
+class MediaStore:
+
+    def __init__(self):
+        self.media = {}
+        # Ids whose heavy fields (genres, tags, studios, relations) are filled in.
+        self.hydrated = set()
+
+    def __getitem__(self, mediaId):
+        return self.media[mediaId]
+
+    def __contains__(self, mediaId):
+        return mediaId in self.media
+
+    def __len__(self):
+        return len(self.media)
+
+    # Uses a record from the MediaCache, with the fields the report needs.
+    def share(self, record):
+        self.media[record.id] = record
+        self.hydrated.add(record.id)
+
+    def add(self, media):
+        record = self.media.get(media['id'])
+        if record is None:
+            record = self.media[media['id']] = MediaRecord(media['id'])
+        record.update(media)
+        return record
+
+    # Turns a ListActivity from the GraphQL response into an ActivityRecord. Only
+    # the first copy of each media is decoded; later activities just reference it.
+    def normalize(self, status):
+        media = status['media']
+        if media['id'] not in self.media:
+            self.add(media)
+
+        progressStart, progressEnd = parseProgress(status['progress'])
+        return ActivityRecord(status.get('id'), status['type'], status['status'], progressStart, progressEnd, status.get('createdAt'), media['id'])
+
+DEFAULT_MEDIA_CACHE_ENTRIES = 50000
+
+# Media records shared by every report in the process, since media ids are
+# global on AniList. Each record is kept with the fields fetched for it so far,
+# and fetching more fields extends the same record, so reports can keep
+# referencing it. The least recently used records are dropped past maxEntries.
+class MediaCache:
+
+    def __init__(self, maxEntries=DEFAULT_MEDIA_CACHE_ENTRIES):
+        self.maxEntries = maxEntries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    # The record for mediaId if all of mediaFields have been fetched for it.
+    def get(self, mediaId, mediaFields):
+        with self.lock:
+            entry = self.entries.get(mediaId)
+            if entry is None or not entry[1].issuperset(mediaFields):
+                return None
+            self.entries.move_to_end(mediaId)
+            return entry[0]
+
+    def add(self, media, mediaFields):
+        with self.lock:
+            entry = self.entries.get(media['id'])
+            if entry is None:
+                entry = self.entries[media['id']] = (MediaRecord(media['id']), set())
+            entry[0].update(media)
+            entry[1].update(mediaFields)
+            self.entries.move_to_end(media['id'])
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+            return entry[0]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,160 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from AnilistCache import DEFAULT_CACHE_PATH
+from AnilistFetch import DEFAULT_YEAR, iterProjectedActivities
+from AnilistStats import WrappedContext, STATS, statsNeedScores, statsMediaFields, newColumnBuilder, newWatchTimeBuilder, newAccumulators, feedAccumulators, wrappedResults
+from AnilistStore import MediaStore
+
+DEFAULT_SYNC_PATH = os.path.join(os.path.dirname(DEFAULT_CACHE_PATH), 'activities.sqlite')
+
+# Everything kept locally for one user and date window: the normalized
+# activities and their media, the high-water mark of the newest activity seen
+# and the accumulators of the stats that only depend on activities.
+class WrappedSnapshot:
+
+    def __init__(self, window, mediaFields):
+        self.window = window
+        self.mediaFields = set(mediaFields)
+        self.activities = []
+        self.mediaStore = MediaStore()
+        self.accumulators = {}
+        self.highWater = None
+
+    # Window that only covers activities newer than the ones already stored.
+    # The newest second is fetched again so that activities logged in the same
+    # second as the high-water mark are not lost; they are dropped by id.
+    def refreshWindow(self):
+        if self.highWater is None:
+            return self.window
+        return (max(self.window[0], self.highWater - 1), self.window[1])
+
+    def merge(self, activities):
+        boundary = self.refreshWindow()[0]
+        knownIds = {activity.id for activity in self.activities if activity.createdAt is not None and activity.createdAt > boundary}
+        newActivities = []
+        for activity in activities:
+            if activity.id not in knownIds:
+                knownIds.add(activity.id)
+                newActivities.append(activity)
+
+        # Stored newest first, like the activity feed.
+        self.activities[:0] = newActivities
+        for activity in newActivities:
+            if activity.createdAt is not None and (self.highWater is None or activity.createdAt > self.highWater):
+                self.highWater = activity.createdAt
+        return newActivities
+
+# Stats whose accumulator only reads activities can be carried over between
+# refreshes and fed just the new activities. Score-based stats are rebuilt from
+# the stored activities on every refresh because the user's scores may have
+# changed since, and so are the watch-time stats, which replay the whole history
+# in order.
+def isIncremental(name):
+    stat = STATS[name]
+    return not getattr(stat, 'needsScores', False) and not getattr(stat, 'needsWatchTime', False)
+
+class SyncStore:
+
+    def __init__(self, path=DEFAULT_SYNC_PATH):
+        self.path = path
+        self.connection = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.connection is None:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    userId INTEGER,
+                    windowStart INTEGER,
+                    windowEnd INTEGER,
+                    updated REAL,
+                    state BLOB,
+                    PRIMARY KEY (userId, windowStart, windowEnd)
+                )''')
+            self.connection.commit()
+        return self.connection
+
+    def load(self, userId, window):
+        with self.lock:
+            row = self.connect().execute('SELECT state FROM snapshots WHERE userId = ? AND windowStart = ? AND windowEnd = ?', (userId, window[0], window[1])).fetchone()
+        if row is None:
+            return None
+        try:
+            return pickle.loads(row[0])
+        except Exception:
+            # Snapshots written by an older version of the stats are rebuilt.
+            return None
+
+    def save(self, userId, snapshot):
+        state = pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            connection = self.connect()
+            connection.execute('INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?)', (userId, snapshot.window[0], snapshot.window[1], time.time(), state))
+            connection.commit()
+
+    def delete(self, userId, window=None):
+        with self.lock:
+            connection = self.connect()
+            if window is None:
+                connection.execute('DELETE FROM snapshots WHERE userId = ?', (userId,))
+            else:
+                connection.execute('DELETE FROM snapshots WHERE userId = ? AND windowStart = ? AND windowEnd = ?', (userId, window[0], window[1]))
+            connection.commit()
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+syncStore = SyncStore()
+
+# buildWrapped backed by the local snapshot store: only activities newer than
+# the stored high-water mark are fetched, incremental stats are fed just those,
+# and everything else is recomputed from the stored activities without network
+# access. A snapshot built for fewer media fields than the stats now need is
+# discarded and rebuilt.
+def syncWrapped(username, stats=None, year=DEFAULT_YEAR, window=None, store=None):
+
+    if stats is None:
+        stats = list(STATS.keys())
+    if store is None:
+        store = syncStore
+
+    context = WrappedContext(username, year=year, window=window)
+    mediaFields = statsMediaFields(stats)
+
+    snapshot = store.load(context.userId, context.window)
+    if snapshot is None or not mediaFields <= snapshot.mediaFields:
+        snapshot = WrappedSnapshot(context.window, mediaFields | (snapshot.mediaFields if snapshot else set()))
+    context.mediaStore = snapshot.mediaStore
+
+    if statsNeedScores(stats):
+        context.prefetchScores()
+    fetched = iterProjectedActivities(context.userId, snapshot.mediaStore, snapshot.mediaFields, snapshot.refreshWindow())
+    newActivities = snapshot.merge(list(fetched))
+
+    # Carried over accumulators only see the new activities, the rest are fed
+    # every stored activity in feed order so ties break as in buildWrapped.
+    carried = {name: snapshot.accumulators[name] for name in stats if isIncremental(name) and name in snapshot.accumulators}
+    rebuilt = newAccumulators(context, [name for name in stats if name not in carried])
+    columns = newColumnBuilder(context, stats)
+    watchTime = newWatchTimeBuilder(context, stats)
+    feedAccumulators(context, carried, newActivities)
+    feedAccumulators(context, rebuilt, snapshot.activities, columns, watchTime)
+
+    accumulators = dict(carried)
+    accumulators.update(rebuilt)
+
+    # Only accumulators fed this refresh are kept, the others would go stale.
+    snapshot.accumulators = {name: accumulator for name, accumulator in accumulators.items() if isIncremental(name)}
+    store.save(context.userId, snapshot)
+
+    return wrappedResults(context, {name: accumulators[name] for name in stats}, columns, watchTime)
@@ -0,0 +1,155 @@
+import datetime
+
+import numpy as np
+
+# Watch time for one report, from which every time-based stat is read. The
+# activities are replayed oldest first and each episode of a show is counted
+# once per viewing: logging an episode again, or a range overlapping an earlier
+# one, adds nothing. A first watch and a rewatch are separate viewings.
+#
+# 'completed' and 'rewatched' carry no progress. They credit the episodes after
+# the last one logged for that viewing, up to the show's episode count, or only
+# the final episode when nothing was logged in the window (the rest may have
+# been watched before it). When the episode count is unknown they credit one
+# episode.
+
+DAY = 24 * 60 * 60
+
+WATCHED, REWATCHED = 0, 1
+KINDS = {
+    'watched episode': (WATCHED, False),
+    'rewatched episode': (REWATCHED, False),
+    'completed': (WATCHED, True),
+    'rewatched': (REWATCHED, True),
+}
+
+# The episodes one activity adds to a viewing, given the episodes already seen
+# in it. None stands for an episode that cannot be told apart from the others.
+def newEpisodes(seen, progressStart, progressEnd, finished, episodeCount):
+    if finished:
+        if not episodeCount:
+            return [None]
+        if not seen:
+            return [episodeCount]
+        return list(range(max(seen) + 1, episodeCount + 1))
+    if progressStart is None:
+        return [None]
+    if progressEnd < progressStart:
+        progressEnd = progressStart
+    return [episode for episode in range(progressStart, progressEnd + 1) if episode not in seen]
+
+class WatchTime:
+
+    def __init__(self, start, watchMinutes, rewatchMinutes, mediaIds, mediaWatchMinutes, mediaRewatchMinutes):
+        self.start = start
+        # Minutes per day of the window, first watches and rewatches apart.
+        self.watchMinutes = watchMinutes
+        self.rewatchMinutes = rewatchMinutes
+        # Minutes per show, in the order the shows first appear in the feed.
+        self.mediaIds = mediaIds
+        self.mediaWatchMinutes = mediaWatchMinutes
+        self.mediaRewatchMinutes = mediaRewatchMinutes
+
+    def daily(self):
+        return self.watchMinutes + self.rewatchMinutes
+
+    def total(self):
+        return float(self.watchMinutes.sum() + self.rewatchMinutes.sum())
+
+    def rewatchTotal(self):
+        return float(self.rewatchMinutes.sum())
+
+    # Weeks start on the first day of the window.
+    def weekly(self):
+        daily = self.daily()
+        return np.add.reduceat(daily, np.arange(0, len(daily), 7)) if len(daily) else daily
+
+    # Days run from the start of the window and are dated in the timezone it
+    # starts at midnight in: the first day is the date whose UTC midnight is
+    # nearest the start, which holds for any offset between UTC-12 and UTC+12.
+    def date(self, day):
+        first = datetime.datetime.fromtimestamp(self.start + DAY // 2, datetime.timezone.utc).date()
+        return first + datetime.timedelta(days=int(day))
+
+    def monthly(self):
+        months = {}
+        for day, minutes in enumerate(self.daily().tolist()):
+            month = self.date(day).strftime('%Y-%m')
+            months[month] = months.get(month, 0) + minutes
+        return months
+
+    def busiestDay(self):
+        daily = self.daily()
+        if not len(daily) or daily.max() == 0:
+            return None
+        return self.date(int(daily.argmax())).isoformat()
+
+    def busiestMonth(self):
+        months = self.monthly()
+        if not months or max(months.values()) == 0:
+            return None
+        return max(months, key=months.get)
+
+    def mediaMinutes(self):
+        return self.mediaWatchMinutes + self.mediaRewatchMinutes
+
+class WatchTimeBuilder:
+
+    def __init__(self, window):
+        self.start = window[0]
+        self.end = window[1]
+        self.kinds = []
+        self.finished = []
+        self.progressStarts = []
+        self.progressEnds = []
+        self.createdAts = []
+        self.mediaIds = []
+        # Per show, in first seen order: duration and episode count.
+        self.media = {}
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def add(self, activity, media):
+        kind = KINDS.get(activity.status)
+        if kind is None or (activity.status == 'completed' and activity.type != 'ANIME_LIST'):
+            return
+        self.kinds.append(kind[0])
+        self.finished.append(kind[1])
+        self.progressStarts.append(activity.progressStart)
+        self.progressEnds.append(activity.progressEnd)
+        self.createdAts.append(activity.createdAt if activity.createdAt is not None else self.start)
+        self.mediaIds.append(media.id)
+        if media.id not in self.media:
+            self.media[media.id] = (media.duration, media.episodes)
+
+    # Can be called again after more activities are added.
+    def finish(self):
+        dayCount = 0 if self.end is None else -(-(self.end - self.start) // DAY)
+        days = [max(0, (createdAt - self.start) // DAY) for createdAt in self.createdAts]
+        dayCount = max([dayCount] + [day + 1 for day in days])
+
+        rows = {mediaId: row for row, mediaId in enumerate(self.media)}
+        minutes = np.zeros((2, dayCount))
+        mediaMinutes = np.zeros((2, len(rows)))
+        seen = {}
+
+        # The feed is newest first; the stable sort keeps activities logged in
+        # the same second in the order they happened.
+        for i in sorted(reversed(range(len(self.kinds))), key=self.createdAts.__getitem__):
+            kind = self.kinds[i]
+            mediaId = self.mediaIds[i]
+            duration, episodeCount = self.media[mediaId]
+            viewing = seen.setdefault((kind, mediaId), set())
+
+            episodes = newEpisodes(viewing, self.progressStarts[i], self.progressEnds[i], self.finished[i], episodeCount)
+            viewing.update(episode for episode in episodes if episode is not None)
+            watched = len(episodes) * duration
+            minutes[kind, days[i]] += watched
+            mediaMinutes[kind, rows[mediaId]] += watched
+
+            # A finished rewatch ends the viewing; the next one starts afresh.
+            if kind == REWATCHED and self.finished[i]:
+                viewing.clear()
+
+        return WatchTime(self.start, minutes[WATCHED], minutes[REWATCHED], list(self.media), mediaMinutes[WATCHED], mediaMinutes[REWATCHED])
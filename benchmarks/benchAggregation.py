@@ -0,0 +1,40 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import AnilistStats
+from AnilistStore import MediaStore
+from synthetic import makeHistory
+
+# Times the stat accumulators alone over synthetic histories of growing size,
+# with no network involved. The cost per activity should stay flat as the
+# history grows. favoriteFive is left out because its tiebreak asks AniList for
+# the user's favourites.
+SIZES = (1250, 2500, 5000, 10000)
+STATS = [name for name in AnilistStats.STATS if name != 'favoriteFive']
+
+def normalizedHistory(activityCount):
+    activities, media, scores = makeHistory(activityCount)
+    mediaStore = MediaStore()
+    records = [mediaStore.normalize(dict(activity, media=media[activity['mediaId']])) for activity in activities]
+    return records, mediaStore, scores
+
+def timeAggregation(activityCount, repeats=3):
+    records, mediaStore, scores = normalizedHistory(activityCount)
+
+    best = None
+    for i in range(repeats):
+        context = AnilistStats.WrappedContext('benchmark', userId=0, showScoreDict=scores, mediaStore=mediaStore)
+        start = time.perf_counter()
+        AnilistStats.computeWrapped(context, records, STATS)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+if __name__ == '__main__':
+    print('activities  shows   total ms  us/activity')
+    for size in SIZES:
+        elapsed = timeAggregation(size)
+        print(str(size).rjust(10), str(size // 10).rjust(6), ('%.1f' % (elapsed * 1000)).rjust(10), ('%.2f' % (elapsed * 1e6 / size)).rjust(12))
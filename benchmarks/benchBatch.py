@@ -0,0 +1,53 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import AnilistFetch
+from AnilistBatch import runBatch
+from AnilistFranchise import mediaClassifier
+from mockServer import startMockServer
+
+# Throughput of the async batch against the mock with artificial latency, for
+# growing numbers of users and of requests in flight. While latency dominates,
+# users per second should grow about linearly with maxInFlight.
+
+def timeBatch(mock, usernames, maxInFlight):
+    AnilistFetch.mediaCache.clear()
+    mediaClassifier.clear()
+    mock.anilist.resetCounters()
+    start = time.perf_counter()
+    reports = runBatch(usernames, maxInFlight=maxInFlight)
+    elapsed = time.perf_counter() - start
+    failed = [username for username, report in reports.items() if isinstance(report, Exception)]
+    if failed:
+        raise Exception("Reports failed for " + ', '.join(failed) + ".")
+    return elapsed, mock.anilist.requestCount
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time runBatch for growing user counts and requests in flight.')
+    parser.add_argument('--profile', default='medium')
+    parser.add_argument('--users', default='4,16')
+    parser.add_argument('--in-flight', default='1,2,4,8,16')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds the mock adds to every response')
+    args = parser.parse_args()
+
+    mock = startMockServer(args.latency)
+    AnilistFetch.url = mock.url
+    AnilistFetch.configureCache(enabled=False)
+    AnilistFetch.configureRateLimit(10 ** 6)
+
+    print('users  in flight  seconds  requests  users/s  speedup')
+    for userCount in [int(count) for count in args.users.split(',')]:
+        usernames = [args.profile + '-' + str(seed) for seed in range(userCount)]
+        for username in usernames:
+            mock.anilist.user(username)
+
+        baseline = None
+        for maxInFlight in [int(count) for count in args.in_flight.split(',')]:
+            elapsed, requests = timeBatch(mock, usernames, maxInFlight)
+            if baseline is None:
+                baseline = elapsed
+            print(str(userCount).rjust(5), str(maxInFlight).rjust(10), ('%.2f' % elapsed).rjust(8), str(requests).rjust(9), ('%.1f' % (userCount / elapsed)).rjust(8), ('%.2f' % (baseline / elapsed)).rjust(8))
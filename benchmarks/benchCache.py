@@ -0,0 +1,58 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import AnilistFetch
+import AnilistStats
+from AnilistBatch import runBatch
+from AnilistFranchise import mediaClassifier
+from mockServer import startMockServer
+
+# Runs the same reports twice against the mock with a fresh on-disk response
+# cache. The second, warm run must not send a single request and must give the
+# same reports. The in-process media cache and classifier are cleared between
+# runs, so only the response cache can answer.
+
+def runTwice(mock, function):
+    results = []
+    for _ in range(2):
+        AnilistFetch.mediaCache.clear()
+        mediaClassifier.clear()
+        mock.anilist.resetCounters()
+        start = time.perf_counter()
+        report = function()
+        results.append((mock.anilist.requestCount, time.perf_counter() - start, report))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that warm re-runs are served from the response cache.')
+    parser.add_argument('--users', default='sparse,medium,heavy')
+    parser.add_argument('--latency', type=float, default=0.01, help='seconds the mock adds to every response')
+    args = parser.parse_args()
+
+    mock = startMockServer(args.latency)
+    AnilistFetch.url = mock.url
+    AnilistFetch.configureRateLimit(10 ** 6)
+    usernames = args.users.split(',')
+    for username in usernames:
+        mock.anilist.user(username)
+
+    path = tempfile.mkdtemp(prefix='anilist-cache-')
+    try:
+        print('run                     cold requests  warm requests  cold s  warm s')
+        for name, function in [(username, lambda username=username: AnilistStats.buildWrapped(username)) for username in usernames] + [('runBatch', lambda: runBatch(usernames))]:
+            AnilistFetch.configureCache(path=os.path.join(path, name + '.sqlite'))
+            (coldRequests, coldSeconds, cold), (warmRequests, warmSeconds, warm) = runTwice(mock, function)
+            print(name.ljust(23), str(coldRequests).rjust(14), str(warmRequests).rjust(14), ('%.2f' % coldSeconds).rjust(7), ('%.2f' % warmSeconds).rjust(7))
+            if warmRequests:
+                raise Exception("The warm " + name + " run sent " + str(warmRequests) + " requests.")
+            if warm != cold:
+                raise Exception("The warm " + name + " run gave a different report.")
+    finally:
+        AnilistFetch.configureCache(enabled=False)
+        shutil.rmtree(path)
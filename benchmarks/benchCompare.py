@@ -0,0 +1,95 @@
+import argparse
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+import AnilistExport
+import AnilistCompare
+from benchParallel import makeInputs
+
+# Builds a community from an exported dataset of synthetic users and times the
+# all-pairs comparisons on it. Sampled pairs are checked against the same
+# numbers computed directly from the two users' score lists.
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def directScores(context):
+    return {mediaId: score for mediaId, score in context.showScoreDict.items() if score > 0}
+
+def directSimilarity(first, second):
+    firstMean = sum(first.values()) / len(first)
+    secondMean = sum(second.values()) / len(second)
+    dot = sum((first[mediaId] - firstMean) * (second[mediaId] - secondMean) for mediaId in first.keys() & second.keys())
+    firstNorm = math.sqrt(sum((score - firstMean) ** 2 for score in first.values()))
+    secondNorm = math.sqrt(sum((score - secondMean) ** 2 for score in second.values()))
+    return dot / (firstNorm * secondNorm)
+
+def check(name, actual, expected):
+    if not math.isclose(actual, expected, rel_tol=1e-9, abs_tol=1e-9):
+        raise Exception(name + " is " + str(actual) + " rather than " + str(expected) + ".")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time community comparisons computed from precomputed feature vectors.')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--activities', type=int, default=1000, help='activities per user')
+    parser.add_argument('--samples', type=int, default=50, help='pairs checked directly')
+    args = parser.parse_args()
+
+    inputs = makeInputs(args.users, args.activities)
+    path = tempfile.mkdtemp(prefix='anilist-compare-')
+    try:
+        with AnilistExport.ExportWriter(os.path.join(path, 'dataset')) as writer:
+            for context, activities in inputs:
+                writer.add(context, activities)
+
+        timings = []
+        elapsed, community = timed(lambda: AnilistCompare.exportedCommunity(os.path.join(path, 'dataset')))
+        timings.append(('build from dataset', elapsed))
+        for kind in AnilistCompare.FEATURES:
+            elapsed, similarity = timed(lambda: community.similarity(kind))
+            timings.append((kind + ' similarity', elapsed))
+            if kind == 'scores':
+                scoreSimilarity = similarity
+        elapsed, deltas = timed(community.scoreDeltas)
+        timings.append(('shared-show deltas', elapsed))
+        elapsed, leaders = timed(lambda: community.leaderboard('controversyScore'))
+        timings.append(('leaderboard', elapsed))
+
+        community.save(os.path.join(path, 'community.npz'))
+        loaded = AnilistCompare.Community.load(os.path.join(path, 'community.npz'))
+        if not np.allclose(loaded.similarity('tags'), community.similarity('tags'), equal_nan=True) or loaded.leaderboard('daysWatched') != community.leaderboard('daysWatched'):
+            raise Exception("The saved community differs from the one it was saved from.")
+
+        print('users ' + str(args.users) + ', ' + str(community.matrix('scores').data.size) + ' scores')
+        for name, elapsed in timings:
+            print(name.ljust(20), ('%.3f s' % elapsed).rjust(9))
+
+        rng = random.Random(0)
+        contexts = [context for context, activities in inputs]
+        for _ in range(args.samples):
+            first, second = rng.sample(range(args.users), 2)
+            firstScores, secondScores = directScores(contexts[first]), directScores(contexts[second])
+            common = sorted(firstScores.keys() & secondScores.keys())
+            check('sharedShows', deltas['sharedShows'][first, second], len(common))
+            if common:
+                differences = [firstScores[mediaId] - secondScores[mediaId] for mediaId in common]
+                check('meanDelta', deltas['meanDelta'][first, second], sum(differences) / len(common))
+                check('rmsDelta', deltas['rmsDelta'][first, second], math.sqrt(sum(d * d for d in differences) / len(common)))
+            check('similarity', scoreSimilarity[first, second], directSimilarity(firstScores, secondScores))
+            if community.sharedShows(contexts[first].username, contexts[second].username) != [(mediaId, firstScores[mediaId], secondScores[mediaId]) for mediaId in common]:
+                raise Exception("sharedShows differs for " + contexts[first].username + " and " + contexts[second].username + ".")
+            nearest = community.mostSimilar(contexts[first].username, top=1)[0]
+            check('mostSimilar', nearest[1], float(np.nanmax(np.where(np.eye(args.users, dtype=bool)[first], np.nan, scoreSimilarity[first]))))
+    finally:
+        shutil.rmtree(path)
@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import AnilistDecode
+from AnilistFetch import buildActivityQuery, ALL_MEDIA_FIELDS, HEAVY_MEDIA_FIELDS, ACTIVITY_PAGE_SIZE, pageStatuses
+from AnilistStore import MediaStore
+from mockServer import MockAnilist
+
+# Decode cost of one activity page with every available decoder: the time to
+# decode the response body, the time to normalize it into activity and media
+# records, and the memory the decoded page and the records take while alive.
+# Pages are built by the mock from the same queries the client sends, once
+# with every media field inline and once with the heavy fields left out as
+# buildWrapped does.
+
+SHAPES = {
+    'all fields': ALL_MEDIA_FIELDS,
+    'inline fields': tuple(field for field in ALL_MEDIA_FIELDS if field not in HEAVY_MEDIA_FIELDS),
+}
+
+def pageBody(anilist, user, mediaFields):
+    query = buildActivityQuery(tuple(sorted(mediaFields)))
+    variables = {'userId': user.id, 'page': 1, 'perPage': ACTIVITY_PAGE_SIZE, 'createdAfter': 0, 'createdBefore': None}
+    return json.dumps(anilist.execute(query, variables)).encode('utf-8')
+
+def bestTime(function, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def retainedBytes(function):
+    tracemalloc.start()
+    value = function()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del value
+    return size
+
+def normalizePage(response):
+    mediaStore = MediaStore()
+    return mediaStore, [mediaStore.normalize(status) for status in pageStatuses(response)]
+
+def benchDecode(repeats=50):
+    anilist = MockAnilist()
+    user = anilist.user('medium')
+
+    results = []
+    for shape, mediaFields in SHAPES.items():
+        body = pageBody(anilist, user, mediaFields)
+        for name in AnilistDecode.DECODERS:
+            loads = AnilistDecode.DECODERS[name][0]
+            response = loads(body)
+            results.append({
+                'shape': shape,
+                'decoder': name,
+                'pageBytes': len(body),
+                'decodeMs': bestTime(lambda: loads(body), repeats) * 1000,
+                'normalizeMs': bestTime(lambda: normalizePage(response), repeats) * 1000,
+                'decodedBytes': retainedBytes(lambda: loads(body)),
+                'recordBytes': retainedBytes(lambda: normalizePage(loads(body))[1]),
+            })
+    return results
+
+def printResults(results):
+    print('shape          decoder   page KiB  decode ms  normalize ms  decoded KiB  records KiB')
+    for result in results:
+        print(result['shape'].ljust(14), result['decoder'].ljust(8), str(result['pageBytes'] // 1024).rjust(9),
+            ('%.3f' % result['decodeMs']).rjust(10), ('%.3f' % result['normalizeMs']).rjust(13),
+            str(result['decodedBytes'] // 1024).rjust(12), str(result['recordBytes'] // 1024).rjust(12))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time decoding one AniList activity page.')
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = benchDecode(args.repeats)
+    printResults(results)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
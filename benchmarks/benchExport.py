@@ -0,0 +1,99 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+import AnilistColumns
+import AnilistExport
+import AnilistStats
+from benchParallel import STATS, makeInputs, timeSerial
+
+# Writes a batch of synthetic users to a dataset in every available format,
+# then recomputes their reports from it, checking they match the reports
+# computed from the records in memory. Peak memory while reading shows that
+# only one user at a time is decoded. The score stats of every user in the
+# dataset are also computed at once with AnilistColumns.batchScoreStats and
+# checked against the same stats in the reports.
+
+SCORE_STATS = ['controversyScore', 'ratingBias', 'scoreDistribution', 'scorePercentiles']
+
+def formats():
+    available = ['npy']
+    try:
+        import pyarrow.parquet
+        available += ['arrow', 'parquet']
+    except ImportError:
+        pass
+    return available
+
+# Seconds batchScoreStats took over the columns of every user in the dataset.
+def timeBatchScoreStats(path, reports):
+    usernames = []
+    columnsList = []
+    for context, activities in AnilistExport.ExportReader(path).iterUsers():
+        AnilistStats.computeWrapped(context, activities, SCORE_STATS)
+        usernames.append(context.username)
+        columnsList.append(context.columns)
+
+    start = time.perf_counter()
+    batch = AnilistColumns.batchScoreStats(columnsList)
+    elapsed = time.perf_counter() - start
+
+    expected = {
+        'controversyScore': [reports[username]['controversyScore'] for username in usernames],
+        'ratingBias': [reports[username]['ratingBias'] for username in usernames],
+        'scoreDistribution': [list(reports[username]['scoreDistribution'].values()) for username in usernames],
+        'scorePercentiles': [[np.nan if value is None else value for value in reports[username]['scorePercentiles'].values()] for username in usernames],
+    }
+    for name, values in expected.items():
+        if not np.allclose(batch[name], np.array(values, dtype=np.float64), equal_nan=True):
+            raise Exception("batchScoreStats gives another " + name + " than the reports.")
+    return elapsed
+
+def datasetBytes(path):
+    return sum(os.path.getsize(os.path.join(directory, name)) for directory, _, names in os.walk(path) for name in names)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time exporting users to a columnar dataset and computing reports from it.')
+    parser.add_argument('--users', type=int, default=64)
+    parser.add_argument('--activities', type=int, default=2000, help='activities per user')
+    parser.add_argument('--users-per-part', type=int, default=16)
+    args = parser.parse_args()
+
+    inputs = makeInputs(args.users, args.activities)
+    expected = dict(timeSerial(inputs)[1])
+
+    print('format   write s   KiB    read+compute s  peak KiB  batch score s')
+    for format in formats():
+        path = tempfile.mkdtemp(prefix='anilist-export-')
+        try:
+            start = time.perf_counter()
+            with AnilistExport.ExportWriter(os.path.join(path, 'dataset'), format, args.users_per_part) as writer:
+                for context, activities in inputs:
+                    writer.add(context, activities)
+            written = time.perf_counter() - start
+
+            start = time.perf_counter()
+            reports = dict(AnilistExport.computeExported(os.path.join(path, 'dataset'), STATS))
+            elapsed = time.perf_counter() - start
+
+            # Measured on a second run, tracemalloc slows everything down.
+            tracemalloc.start()
+            for report in AnilistExport.computeExported(os.path.join(path, 'dataset'), STATS):
+                pass
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            if reports != expected:
+                raise Exception("Reports computed from the " + format + " dataset differ from the ones computed in memory.")
+            batchSeconds = timeBatchScoreStats(os.path.join(path, 'dataset'), reports)
+            print(format.ljust(8), ('%.2f' % written).rjust(7), str(datasetBytes(path) // 1024).rjust(7), ('%.2f' % elapsed).rjust(16), str(peak // 1024).rjust(9), ('%.4f' % batchSeconds).rjust(14))
+        finally:
+            shutil.rmtree(path)
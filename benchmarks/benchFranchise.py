@@ -0,0 +1,61 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import AnilistFetch
+from AnilistFranchise import mediaClassifier
+from mockServer import startMockServer
+
+# Franchise roots of every show a synthetic user knows, resolved by the shared
+# classifier in batched lookups. The roots must match a walk of the prequel
+# edges the mock serves, and resolving the same shows again must not send a
+# request.
+
+# The first show of mediaId's franchise from the raw media, following the
+# first anime prequel until it is unknown or closes a loop.
+def expectedRoot(media, mediaId):
+    seen = set()
+    while True:
+        seen.add(mediaId)
+        prequelId = next((edge['node']['id'] for edge in media[mediaId]['relations']['edges'] if edge['relationType'] == 'PREQUEL' and edge['node']['type'] == 'ANIME'), None)
+        if prequelId is None or prequelId not in media or prequelId in seen:
+            return mediaId
+        mediaId = prequelId
+
+def timeRoots(mock, ids):
+    mock.anilist.resetCounters()
+    start = time.perf_counter()
+    roots = mediaClassifier.franchiseRoots(ids)
+    return roots, mock.anilist.requestCount, time.perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Resolve franchise roots of a user\'s shows against the mock.')
+    parser.add_argument('--profile', default='heavy')
+    args = parser.parse_args()
+
+    mock = startMockServer()
+    AnilistFetch.url = mock.url
+    AnilistFetch.configureCache(enabled=False)
+    AnilistFetch.configureRateLimit(10 ** 6)
+    mock.anilist.user(args.profile)
+
+    media = dict(mock.anilist.media)
+    ids = sorted(media)
+    mediaClassifier.clear()
+    roots, coldRequests, coldSeconds = timeRoots(mock, ids)
+    again, warmRequests, warmSeconds = timeRoots(mock, ids)
+
+    print('shows  franchises  cold requests  warm requests  cold s')
+    print(str(len(ids)).rjust(5), str(len(set(roots.values()))).rjust(11), str(coldRequests).rjust(14), str(warmRequests).rjust(14), ('%.2f' % coldSeconds).rjust(7))
+
+    expected = {mediaId: expectedRoot(media, mediaId) for mediaId in ids}
+    if roots != expected:
+        wrong = [mediaId for mediaId in ids if roots.get(mediaId) != expected[mediaId]]
+        raise Exception(str(len(wrong)) + " shows got the wrong franchise root, e.g. " + str(wrong[0]) + ".")
+    if again != roots:
+        raise Exception("Resolving the same shows again gave other roots.")
+    if warmRequests:
+        raise Exception("Resolving the same shows again sent " + str(warmRequests) + " requests.")
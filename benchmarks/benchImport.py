@@ -0,0 +1,55 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Cold-start guard: imports each module in a fresh interpreter under
+# -X importtime and reports the median cumulative import time. It fails when a
+# module goes over its budget or when importing it pulls in a heavy dependency
+# that should only load on demand (matplotlib for charts, NumPy for the score
+# columns).
+
+MODULES = ['AnilistFetch', 'AnilistStats', 'AnilistWrapped']
+LAZY_DEPENDENCIES = ['matplotlib', 'numpy']
+DEFAULT_BUDGET_MS = 400
+
+def importOnce(module):
+    code = 'import sys, ' + module + '; print(",".join(sorted({m.split(".")[0] for m in sys.modules} & ' + repr(set(LAZY_DEPENDENCIES)) + ')))'
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+
+    microseconds = None
+    for line in process.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            microseconds = int(fields[1])
+    loaded = [name for name in process.stdout.strip().split(',') if name]
+    return microseconds / 1000, loaded
+
+def benchImport(modules=MODULES, repeats=5):
+    results = []
+    for module in modules:
+        times = []
+        loaded = []
+        for _ in range(repeats):
+            milliseconds, loaded = importOnce(module)
+            times.append(milliseconds)
+        results.append({'module': module, 'medianMs': statistics.median(times), 'minMs': min(times), 'lazyLoaded': loaded})
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure cold import time of the AnilistWrapped modules.')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS, help='fail when a median import takes longer')
+    args = parser.parse_args()
+
+    failed = False
+    print('module            median ms   min ms  eagerly loaded')
+    for result in benchImport(repeats=args.repeats):
+        print(result['module'].ljust(16), ('%.1f' % result['medianMs']).rjust(10), ('%.1f' % result['minMs']).rjust(8), ' ' + (', '.join(result['lazyLoaded']) or '-'))
+        if result['medianMs'] > args.budget_ms or result['lazyLoaded']:
+            failed = True
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,98 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import AnilistFetch
+import AnilistStats
+import AnilistPaging
+from AnilistJournal import BatchJournal, runJournaled
+from mockServer import startMockServer
+
+# A journaled batch against a flaky mock AniList, killed part way through and
+# started again. The resumed run must finish every user with the reports
+# buildWrapped gives, and pages may only be served twice if they were in flight
+# when the first run was killed.
+
+def configure(url):
+    AnilistFetch.url = url
+    AnilistFetch.configureCache(enabled=False)
+    AnilistFetch.configureRateLimit(10 ** 6)
+
+def finishedUsers(path):
+    if not os.path.exists(path):
+        return 0
+    journal = BatchJournal(path)
+    try:
+        return sum(1 for row in journal.summary() if row[1] == 'done')
+    except Exception:
+        return 0
+    finally:
+        journal.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Kill a journaled batch part way through and resume it.')
+    parser.add_argument('--profile', default='medium')
+    parser.add_argument('--users', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--fault-rate', type=float, default=0.02, help='share of requests answered without data')
+    parser.add_argument('--child', nargs=2, metavar=('URL', 'JOURNAL'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    usernames = [args.profile + '-' + str(seed) for seed in range(args.users)]
+
+    if args.child:
+        configure(args.child[0])
+        runJournaled(usernames, journal=BatchJournal(args.child[1]), workers=args.workers)
+        sys.exit(0)
+
+    mock = startMockServer()
+    configure(mock.url)
+    for username in usernames:
+        mock.anilist.user(username)
+
+    expected = {}
+    for username in usernames:
+        AnilistFetch.mediaCache.clear()
+        expected[username] = AnilistStats.buildWrapped(username)
+
+    path = tempfile.mkdtemp(prefix='anilist-journal-')
+    journalPath = os.path.join(path, 'batch.sqlite')
+    try:
+        mock.anilist.faultRate = args.fault_rate
+        mock.anilist.resetCounters()
+
+        start = time.perf_counter()
+        child = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--profile', args.profile, '--users', str(args.users), '--workers', str(args.workers), '--child', mock.url, journalPath])
+        while child.poll() is None and finishedUsers(journalPath) < args.users // 2:
+            time.sleep(0.05)
+        child.kill()
+        child.wait()
+        killedAfter = finishedUsers(journalPath)
+
+        AnilistFetch.mediaCache.clear()
+        journal = BatchJournal(journalPath)
+        reports = runJournaled(usernames, journal=journal, workers=args.workers)
+        elapsed = time.perf_counter() - start
+        summary = journal.summary()
+        journal.close()
+
+        repeated = sum(count - 1 for count in mock.anilist.pagesServed.values())
+        print('users  killed after  faults  requests  pages served twice  seconds')
+        print(str(args.users).rjust(5), str(killedAfter).rjust(13), str(mock.anilist.faults).rjust(7), str(mock.anilist.requestCount).rjust(9), str(repeated).rjust(19), ('%.2f' % elapsed).rjust(8))
+
+        if any(row[1] != 'done' for row in summary):
+            raise Exception("Users left unfinished: " + ', '.join(row[0] for row in summary if row[1] != 'done'))
+        if reports != expected:
+            raise Exception("Reports of the resumed batch differ from buildWrapped.")
+        # Pages are journaled as they arrive, so only the kill drops pages: at
+        # most lookAhead in flight per user in progress.
+        if repeated > args.workers * AnilistPaging.lookAhead:
+            raise Exception(str(repeated) + " pages were served more than once.")
+    finally:
+        shutil.rmtree(path)
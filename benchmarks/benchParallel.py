@@ -0,0 +1,68 @@
+import argparse
+import os
+import pickle
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import AnilistStats
+import AnilistParallel
+from AnilistStore import MediaStore
+from synthetic import makeHistory
+
+# Reports for a batch of synthetic users computed serially and on process pools
+# of growing size, from already normalized activities. Also shows how large the
+# packed input of one chunk is compared with pickling the records directly.
+# favoriteFive is left out because its tiebreak asks AniList for favourites.
+STATS = [name for name in AnilistStats.STATS if name != 'favoriteFive']
+
+# Media ids are global on AniList, so every user draws from the same catalogue.
+def makeInputs(userCount, activityCount):
+    catalogue = makeHistory(activityCount)[1]
+    inputs = []
+    for seed in range(userCount):
+        activities, _, scores = makeHistory(activityCount, seed=seed)
+        mediaStore = MediaStore()
+        records = [mediaStore.normalize(dict(activity, media=catalogue[activity['mediaId']])) for activity in activities]
+        context = AnilistStats.WrappedContext('user-' + str(seed), userId=seed, showScoreDict=scores, mediaStore=mediaStore)
+        inputs.append((context, records))
+    return inputs
+
+def timeSerial(inputs):
+    start = time.perf_counter()
+    reports = [(context.username, AnilistStats.computeWrapped(context, activities, STATS)) for context, activities in inputs]
+    return time.perf_counter() - start, reports
+
+def timeParallel(inputs, processes, chunkSize):
+    start = time.perf_counter()
+    reports = list(AnilistParallel.computeBatch(inputs, STATS, processes, chunkSize))
+    return time.perf_counter() - start, reports
+
+def inputSizes(inputs, chunkSize):
+    chunk = inputs[:chunkSize]
+    packed = len(pickle.dumps(AnilistParallel.packChunk(chunk, STATS), pickle.HIGHEST_PROTOCOL))
+    raw = len(pickle.dumps([(activities, context.mediaStore.media, context.showScoreDict) for context, activities in chunk], pickle.HIGHEST_PROTOCOL))
+    return packed, raw
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time computing reports on a process pool.')
+    parser.add_argument('--users', type=int, default=64)
+    parser.add_argument('--activities', type=int, default=2000, help='activities per user')
+    parser.add_argument('--processes', default='1,2,4,8,16', help='comma separated pool sizes')
+    parser.add_argument('--chunk-size', type=int, default=AnilistParallel.DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    inputs = makeInputs(args.users, args.activities)
+    packed, raw = inputSizes(inputs, args.chunk_size)
+    print('cpus', os.cpu_count(), '- one chunk of', args.chunk_size, 'users:', packed // 1024, 'KiB packed,', raw // 1024, 'KiB as pickled records')
+
+    serial, expected = timeSerial(inputs)
+    print('processes  seconds  users/s  speedup')
+    print('serial'.rjust(9), ('%.2f' % serial).rjust(8), ('%.0f' % (len(inputs) / serial)).rjust(8), '1.00'.rjust(8))
+
+    for processes in [int(count) for count in args.processes.split(',')]:
+        elapsed, reports = timeParallel(inputs, processes, args.chunk_size)
+        if reports != expected:
+            raise Exception("Reports computed on " + str(processes) + " processes differ from the serial ones.")
+        print(str(processes).rjust(9), ('%.2f' % elapsed).rjust(8), ('%.0f' % (len(inputs) / elapsed)).rjust(8), ('%.2f' % (serial / elapsed)).rjust(8))
@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import AnilistFetch
+import AnilistStats
+import AnilistPaging
+from AnilistFranchise import mediaClassifier
+from AnilistService import WrappedService
+from mockServer import startMockServer
+
+# A burst of concurrent page views for one user against the Wrapped service,
+# backed by the local mock AniList. The burst must cost the upstream requests
+# of a single report, a second burst none at all, and the streamed report must
+# end with the same report the JSON endpoint serves. Pages are fetched one at
+# a time, since speculative look-ahead makes the request count of a report vary
+# from run to run.
+
+def startService(service):
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(service.start(port=0))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return 'http://127.0.0.1:' + str(server.sockets[0].getsockname()[1])
+
+def get(url):
+    with urllib.request.urlopen(url) as response:
+        return response.read()
+
+def burst(url, clients):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        bodies = list(executor.map(get, [url] * clients))
+    return time.perf_counter() - start, bodies
+
+# Starts from an empty shared media cache and classifier so that every
+# measurement fetches the same media.
+def upstreamRequests(mock, function):
+    if AnilistFetch.mediaCache is not None:
+        AnilistFetch.mediaCache.clear()
+    mediaClassifier.clear()
+    mock.anilist.resetCounters()
+    result = function()
+    return mock.anilist.requestCount, result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time a burst of requests for one user against the Wrapped service.')
+    parser.add_argument('--user', default='heavy', help='mock user, e.g. medium or heavy-3')
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds the mock adds to every response')
+    args = parser.parse_args()
+
+    mock = startMockServer(args.latency)
+    AnilistFetch.url = mock.url
+    AnilistFetch.configureCache(enabled=False)
+    AnilistFetch.configureRateLimit(10 ** 6)
+    AnilistPaging.configurePaging(1)
+    mock.anilist.user(args.user)
+
+    # favoriteFive asks AniList for favourites on score ties, so it is left out
+    # to keep the upstream count of one report fixed.
+    stats = [name for name in AnilistStats.STATS if name != 'favoriteFive']
+    single, expected = upstreamRequests(mock, lambda: AnilistStats.buildWrapped(args.user, stats))
+
+    service = WrappedService(stats, partialEvery=1000)
+    base = startService(service)
+    url = base + '/wrapped/' + args.user
+
+    print('one report:', single, 'upstream requests')
+    print('burst           seconds  upstream requests')
+    for name in ['cold', 'cached']:
+        requests, (elapsed, bodies) = upstreamRequests(mock, lambda: burst(url, args.clients))
+        if any(json.loads(body) != json.loads(json.dumps(expected)) for body in bodies):
+            raise Exception("The service served a report that differs from buildWrapped.")
+        print((name + ' x' + str(args.clients)).ljust(14), ('%.2f' % elapsed).rjust(8), str(requests).rjust(18))
+        if requests != (single if name == 'cold' else 0):
+            raise Exception("A " + name + " burst cost " + str(requests) + " upstream requests.")
+
+    service.cache.clear()
+    lines = [json.loads(line) for line in get(url + '/stream').splitlines()]
+    if lines[-1]['report'] != json.loads(bodies[0]):
+        raise Exception("The streamed report differs from the JSON one.")
+    print('stream:', len(lines) - 1, 'partial results before the report')
+
+    start = time.perf_counter()
+    image = get(url + '/favoriteGenre.png')
+    print('favoriteGenre.png:', len(image) // 1024, 'KiB in', '%.2f' % (time.perf_counter() - start), 'seconds')
+    service.close()
@@ -0,0 +1,47 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import AnilistFetch
+from AnilistBatch import runBatch
+from AnilistFranchise import mediaClassifier
+from mockServer import startMockServer
+
+# Upstream cost of a community batch with media metadata inline in every
+# activity and with the shared media cache, where activities carry only media
+# ids and each show is hydrated once for all users. Synthetic users of the same
+# size draw from the same shows, like a community watching the same season.
+
+def runMode(mock, usernames, shared):
+    AnilistFetch.configureMediaCache(enabled=shared)
+    mediaClassifier.clear()
+    mock.anilist.resetCounters()
+    reports = runBatch(usernames)
+    return mock.anilist.requestCount, mock.anilist.bytesSent, reports
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare upstream bytes of a batch with and without the shared media cache.')
+    parser.add_argument('--profile', default='heavy')
+    parser.add_argument('--users', type=int, default=8)
+    args = parser.parse_args()
+
+    mock = startMockServer()
+    AnilistFetch.url = mock.url
+    AnilistFetch.configureCache(enabled=False)
+    AnilistFetch.configureRateLimit(10 ** 6)
+
+    usernames = [args.profile + '-' + str(seed) for seed in range(args.users)]
+    for username in usernames:
+        mock.anilist.user(username)
+
+    results = {}
+    print('media         requests  KiB total  KiB per user')
+    for name, shared in [('inline', False), ('shared cache', True)]:
+        requests, bytesSent, results[name] = runMode(mock, usernames, shared)
+        print(name.ljust(12), str(requests).rjust(9), str(bytesSent // 1024).rjust(10), str(bytesSent // 1024 // len(usernames)).rjust(13))
+
+    if results['inline'] != results['shared cache']:
+        raise Exception("Reports with the shared media cache differ from the inline ones.")
+    AnilistFetch.configureMediaCache()
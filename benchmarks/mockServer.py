@@ -0,0 +1,263 @@
+import collections
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from synthetic import PROFILES, SPARSE_PROFILES, makeHistory
+
+# Local stand-in for graphql.anilist.co. It answers the User, favourites,
+# activities, mediaList and media(id_in) queries this project sends, from
+# synthetic histories, and trims every response to the fields the query selects
+# so that response sizes match what AniList would send.
+#
+# Users are looked up by name: "<profile>" or "<profile>-<seed>", where profile
+# is one of synthetic.PROFILES (e.g. "heavy-3").
+#
+# With faultRate set, that share of requests is answered 200 with an error and
+# no data, the way a flaky gateway can answer mid-pagination.
+
+TOKEN = re.compile(r'\.\.\.|[A-Za-z_][A-Za-z0-9_]*|[{}]|\([^)]*\)')
+
+# Parses a GraphQL selection set into {field: subselection}, with inline
+# fragments merged into their parent and arguments dropped.
+def parseSelection(tokens, position):
+    selection = {}
+    while position < len(tokens) and tokens[position] != '}':
+        token = tokens[position]
+        position += 1
+        if token == '...':
+            # "... on Type {": skip to the fragment's selection.
+            fragment, position = parseSelection(tokens, position + 3)
+            selection.update(fragment)
+            continue
+        if position < len(tokens) and tokens[position].startswith('('):
+            position += 1
+        children = None
+        if position < len(tokens) and tokens[position] == '{':
+            children, position = parseSelection(tokens, position + 1)
+        selection[token] = children
+    return selection, position + 1
+
+def querySelection(query):
+    tokens = TOKEN.findall(query)
+    start = tokens.index('{')
+    selection, position = parseSelection(tokens, start + 1)
+    return selection
+
+def project(value, selection):
+    if selection is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, selection) for item in value]
+    if isinstance(value, dict):
+        return {field: project(value[field], children) for field, children in selection.items() if field in value}
+    return value
+
+class MockUser:
+
+    def __init__(self, userId, username, activityCount, seed, sparse=False):
+        self.id = userId
+        self.name = username
+        self.activities, self.media, self.scores = makeHistory(activityCount, seed=seed, sparse=sparse)
+        ratedIds = [mediaId for mediaId, score in self.scores.items() if score > 0]
+        self.favourites = sorted(ratedIds, key=lambda mediaId: -self.scores[mediaId])[:10]
+
+class MockAnilist:
+
+    def __init__(self, latency=0, requestsPerMinute=None, activityCounts=PROFILES, faultRate=0):
+        self.latency = latency
+        self.requestsPerMinute = requestsPerMinute
+        self.faultRate = faultRate
+        self.faultRandom = random.Random(0)
+        self.activityCounts = activityCounts
+        self.users = {}
+        self.usersById = {}
+        self.media = {}
+        self.lock = threading.Lock()
+        self.requestTimes = []
+        self.resetCounters()
+
+    def resetCounters(self):
+        with self.lock:
+            self.requestCount = 0
+            self.bytesSent = 0
+            self.rateLimited = 0
+            self.faults = 0
+            # Activity and score list pages answered, per (field, userId, page).
+            self.pagesServed = collections.Counter()
+
+    def user(self, username):
+        with self.lock:
+            if username not in self.users:
+                profile, _, seed = username.partition('-')
+                if profile not in self.activityCounts:
+                    return None
+                user = MockUser(len(self.users) + 1, username, self.activityCounts[profile], int(seed or 0), profile in SPARSE_PROFILES)
+                self.users[username] = user
+                self.usersById[user.id] = user
+                self.media.update(user.media)
+            return self.users[username]
+
+    # Returns the seconds to wait when the request is over the rate limit.
+    def throttle(self):
+        if self.requestsPerMinute is None:
+            return None
+        with self.lock:
+            now = time.monotonic()
+            self.requestTimes = [sent for sent in self.requestTimes if sent > now - 60]
+            if len(self.requestTimes) >= self.requestsPerMinute:
+                self.rateLimited += 1
+                return max(1, int(self.requestTimes[0] + 60 - now) + 1)
+            self.requestTimes.append(now)
+            return None
+
+    def fault(self):
+        with self.lock:
+            if self.faultRate and self.faultRandom.random() < self.faultRate:
+                self.faults += 1
+                return True
+            return False
+
+    def countPage(self, field, variables):
+        with self.lock:
+            self.pagesServed[(field, variables.get('userId'), max(1, variables.get('page') or 1))] += 1
+
+    def remaining(self):
+        if self.requestsPerMinute is None:
+            return None
+        return max(0, self.requestsPerMinute - len(self.requestTimes))
+
+    def page(self, items, variables, field):
+        perPage = variables.get('perPage', 50)
+        page = max(1, variables.get('page') or 1)
+        lastPage = max(1, (len(items) + perPage - 1) // perPage)
+        pageInfo = {'total': len(items), 'perPage': perPage, 'currentPage': page, 'lastPage': lastPage, 'hasNextPage': page < lastPage}
+        return {'pageInfo': pageInfo, field: items[(page - 1) * perPage:page * perPage]}
+
+    def execute(self, query, variables):
+        selection = querySelection(query)
+
+        if 'User' in selection and 'favourites' in (selection['User'] or {}):
+            user = self.usersById.get(variables.get('userId'))
+            nodes = [self.media[mediaId] for mediaId in user.favourites] if user else []
+            return {'data': project({'User': {'favourites': {'anime': {'nodes': nodes}}}}, selection)}
+
+        if 'User' in selection:
+            user = self.user(variables.get('userName'))
+            if user is None:
+                return {'errors': [{'message': 'Not Found.', 'status': 404}], 'data': {'User': None}}
+            return {'data': project({'User': {'id': user.id, 'name': user.name}}, selection)}
+
+        pageSelection = selection.get('Page') or {}
+
+        if 'activities' in pageSelection:
+            user = self.usersById.get(variables.get('userId'))
+            after = variables.get('createdAfter', 0) or 0
+            before = variables.get('createdBefore')
+            items = []
+            for activity in user.activities if user else []:
+                if activity['createdAt'] > after and (before is None or activity['createdAt'] < before):
+                    items.append(dict(activity, media=self.media[activity['mediaId']]))
+            self.countPage('activities', variables)
+            return {'data': project({'Page': self.page(items, variables, 'activities')}, selection)}
+
+        if 'mediaList' in pageSelection:
+            user = self.usersById.get(variables.get('userId'))
+            items = [{'mediaId': mediaId, 'score': score, 'media': self.media[mediaId]} for mediaId, score in (user.scores.items() if user else [])]
+            self.countPage('mediaList', variables)
+            return {'data': project({'Page': self.page(items, variables, 'mediaList')}, selection)}
+
+        if 'media' in pageSelection:
+            ids = variables.get('ids') or []
+            items = [self.media[mediaId] for mediaId in ids if mediaId in self.media]
+            return {'data': project({'Page': self.page(items, variables, 'media')}, selection)}
+
+        return {'errors': [{'message': 'Unsupported query.', 'status': 400}]}
+
+def makeHandler(anilist):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+
+            if anilist.latency:
+                time.sleep(anilist.latency)
+
+            retryAfter = anilist.throttle()
+            if retryAfter is not None:
+                self.reply(429, {'errors': [{'message': 'Too Many Requests.', 'status': 429}], 'data': None}, {'Retry-After': str(retryAfter)})
+                return
+
+            if anilist.fault():
+                self.reply(200, {'errors': [{'message': 'Internal Server Error.', 'status': 500}]})
+                return
+
+            response = anilist.execute(body['query'], body.get('variables') or {})
+            status = response['errors'][0]['status'] if 'errors' in response else 200
+            self.reply(status, response)
+
+        def reply(self, status, response, headers={}):
+            payload = json.dumps(response).encode('utf-8')
+            with anilist.lock:
+                anilist.requestCount += 1
+                anilist.bytesSent += len(payload)
+
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            if anilist.requestsPerMinute is not None:
+                self.send_header('X-RateLimit-Limit', str(anilist.requestsPerMinute))
+                self.send_header('X-RateLimit-Remaining', str(anilist.remaining()))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return Handler
+
+class MockServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, anilist, port=0):
+        self.anilist = anilist
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', port), makeHandler(anilist))
+
+    # Clients killed halfway through a request are not errors of the mock.
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], (ConnectionError, ValueError)):
+            ThreadingHTTPServer.handle_error(self, request, client_address)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:' + str(self.server_address[1])
+
+def startMockServer(latency=0, requestsPerMinute=None, activityCounts=PROFILES, port=0, faultRate=0):
+    server = MockServer(MockAnilist(latency, requestsPerMinute, activityCounts, faultRate), port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve synthetic AniList data on localhost.')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to every response')
+    parser.add_argument('--rate-limit', type=int, default=None, help='requests per minute before answering 429')
+    args = parser.parse_args()
+
+    server = MockServer(MockAnilist(args.latency, args.rate_limit), args.port)
+    print('Mock AniList listening on ' + server.url)
+    server.serve_forever()
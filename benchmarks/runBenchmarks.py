@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import AnilistFetch
+import AnilistStats
+import AnilistPaging
+import AnilistDecode
+from mockServer import startMockServer
+from synthetic import PROFILES
+
+# Runs every stat on its own and the full report against the local mock
+# AniList, for each synthetic profile, and reports wall time, requests, bytes
+# received and peak Python memory. Caching is off, the shared media cache is
+# emptied before every run and the client rate limit is lifted so the numbers
+# measure the fetch and stats code itself.
+
+def measure(server, function, trackMemory):
+    if AnilistFetch.mediaCache is not None:
+        AnilistFetch.mediaCache.clear()
+    server.anilist.resetCounters()
+    if trackMemory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+
+    peak = None
+    if trackMemory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        'seconds': elapsed,
+        'requests': server.anilist.requestCount,
+        'bytes': server.anilist.bytesSent,
+        'peakBytes': peak,
+    }
+
+def benchmarks(username):
+    cases = [(name, lambda name=name: AnilistStats.buildWrapped(username, [name])) for name in AnilistStats.STATS]
+    cases.append(('full report', lambda: AnilistStats.buildWrapped(username)))
+    return cases
+
+def runBenchmarks(profiles, latency=0, requestsPerMinute=None, trackMemory=True, lookAhead=AnilistPaging.DEFAULT_LOOK_AHEAD):
+    server = startMockServer(latency, requestsPerMinute)
+    AnilistPaging.configurePaging(lookAhead)
+    AnilistFetch.url = server.url
+    AnilistFetch.configureCache(enabled=False)
+    AnilistFetch.configureRateLimit(requestsPerMinute or 10 ** 6)
+
+    results = []
+    try:
+        for profile in profiles:
+            # Build the synthetic user before timing anything.
+            server.anilist.user(profile)
+            for name, function in benchmarks(profile):
+                result = measure(server, function, False)
+                if trackMemory:
+                    result['peakBytes'] = measure(server, function, True)['peakBytes']
+                result.update({'profile': profile, 'benchmark': name})
+                results.append(result)
+    finally:
+        server.shutdown()
+    return results
+
+def printResults(results):
+    print('profile   benchmark                        seconds  requests      bytes  peak KiB')
+    for result in results:
+        peak = '-' if result['peakBytes'] is None else str(result['peakBytes'] // 1024)
+        print(result['profile'].ljust(9), result['benchmark'].ljust(30), ('%.3f' % result['seconds']).rjust(9),
+            str(result['requests']).rjust(9), str(result['bytes']).rjust(10), peak.rjust(9))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark AnilistWrapped against a local mock AniList.')
+    parser.add_argument('--profiles', default='sparse,light,medium,heavy', help='comma separated, from: ' + ', '.join(PROFILES))
+    parser.add_argument('--latency', type=float, default=0, help='seconds the mock adds to every response')
+    parser.add_argument('--rate-limit', type=int, default=None, help='requests per minute the mock allows')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--look-ahead', type=int, default=AnilistPaging.DEFAULT_LOOK_AHEAD, help='pages fetched ahead of the one being read, 1 for strictly sequential paging')
+    parser.add_argument('--decoder', choices=sorted(AnilistDecode.DECODERS), default=AnilistDecode.decoder, help='JSON decoder for response bodies')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    AnilistDecode.configureDecoder(args.decoder)
+    results = runBenchmarks(args.profiles.split(','), args.latency, args.rate_limit, not args.no_memory, args.look_ahead)
+    printResults(results)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
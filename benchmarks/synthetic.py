@@ -0,0 +1,94 @@
+import random
+
+# Synthetic AniList data shaped like the GraphQL responses, for benchmarks that
+# must not touch graphql.anilist.co.
+
+GENRES = ['Action', 'Adventure', 'Comedy', 'Drama', 'Ecchi', 'Fantasy', 'Horror', 'Mahou Shoujo', 'Mecha', 'Music', 'Mystery', 'Psychological', 'Romance', 'Sci-Fi', 'Slice of Life', 'Sports', 'Supernatural', 'Thriller']
+TAG_CATEGORIES = ['Theme-Action', 'Theme-Comedy', 'Theme-Drama', 'Theme-Other', 'Cast-Traits', 'Cast-Main Cast', 'Demographic', 'Setting-Scene', 'Technical']
+STUDIOS = ['Studio ' + letter for letter in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ']
+FORMATS = ['TV', 'TV', 'TV', 'TV_SHORT', 'MOVIE', 'ONA', 'OVA']
+RELATION_TYPES = ['PREQUEL', 'SEQUEL', 'SIDE_STORY', 'ADAPTATION', 'CHARACTER', 'OTHER']
+
+# Activity counts of the standard profiles, from a casual user to the heaviest
+# accounts we have seen. A sparse user only plans and drops shows, none of
+# which has a demographic tag or an animation studio, so every stat that needs
+# a watched show has nothing to report.
+PROFILES = {
+    'sparse': 10,
+    'light': 50,
+    'medium': 500,
+    'heavy': 5000,
+    'extreme': 20000,
+}
+
+SPARSE_PROFILES = {'sparse'}
+SPARSE_STATUSES = ['plans to watch', 'dropped']
+# Shows of sparse users are numbered apart from the shared catalogue, which
+# they would otherwise replace in the mock.
+SPARSE_MEDIA_START = 10 ** 6
+
+# 2023-01-01, where the Wrapped year starts.
+YEAR_START = 1672549200
+
+def makeMedia(mediaId, rng):
+    return {
+        'id': mediaId,
+        'type': 'ANIME',
+        'title': {'romaji': 'Synthetic Show ' + str(mediaId)},
+        'duration': rng.choice([3, 12, 24, 24, 24, 25, 100]),
+        'episodes': rng.choice([1, 12, 13, 24, 25]),
+        'seasonYear': rng.choice([2019, 2021, 2022, 2023, 2023]),
+        'format': rng.choice(FORMATS),
+        'averageScore': rng.randint(40, 90),
+        'genres': rng.sample(GENRES, rng.randint(1, 4)),
+        'tags': [{'name': 'Tag ' + str(rng.randint(1, 300)), 'category': rng.choice(TAG_CATEGORIES), 'rank': rng.randint(1, 100)} for i in range(rng.randint(5, 25))],
+        'studios': {'nodes': [{'name': rng.choice(STUDIOS), 'isAnimationStudio': rng.random() < 0.8} for i in range(rng.randint(1, 3))]},
+        'relations': {'edges': [makeRelation(mediaId, i, rng.choice(RELATION_TYPES)) for i in range(rng.randint(0, 6))]},
+    }
+
+# Prequels point at lower ids and everything else at higher ones, so franchises
+# form chains. Nodes are derived from the id rather than drawn from rng, which
+# keeps the rest of the generated data as it was.
+def makeRelation(mediaId, index, relationType):
+    nodeId = mediaId - 1 - index if relationType == 'PREQUEL' else mediaId + 1 + index
+    return {'relationType': relationType, 'node': {'id': nodeId, 'type': 'ANIME'}}
+
+def makeProgress(rng):
+    start = rng.randint(1, 24)
+    if rng.random() < 0.6:
+        return str(start)
+    return str(start) + ' - ' + str(start + rng.randint(1, 5))
+
+# A user's year: activityCount list activities spread over showCount shows
+# (one per ten activities by default), the media they point at and the user's
+# scores. Activities come newest first, like the AniList activity feed.
+def makeHistory(activityCount, showCount=None, seed=0, sparse=False):
+    rng = random.Random(seed)
+    if showCount is None:
+        showCount = max(1, activityCount // 10)
+    firstId = SPARSE_MEDIA_START if sparse else 1
+
+    media = {mediaId: makeMedia(mediaId, rng) for mediaId in range(firstId, firstId + showCount)}
+    if sparse:
+        for show in media.values():
+            show['tags'] = [tag for tag in show['tags'] if tag['category'] != 'Demographic']
+            show['studios'] = {'nodes': [dict(studio, isAnimationStudio=False) for studio in show['studios']['nodes']]}
+    scores = {mediaId: rng.choice([0, rng.randint(1, 100)]) for mediaId in media}
+
+    activities = []
+    for index in range(activityCount):
+        mediaId = rng.randint(firstId, firstId + showCount - 1)
+        if sparse:
+            status = rng.choice(SPARSE_STATUSES)
+        else:
+            status = rng.choices(['watched episode', 'rewatched episode', 'completed', 'rewatched', 'plans to watch', 'dropped'], [70, 5, 12, 2, 8, 3])[0]
+        activities.append({
+            'id': 10 ** 9 - index,
+            'createdAt': YEAR_START + (activityCount - index) * 60,
+            'type': 'ANIME_LIST',
+            'status': status,
+            'progress': makeProgress(rng) if status.endswith('episode') else None,
+            'mediaId': mediaId,
+        })
+
+    return activities, media, scores